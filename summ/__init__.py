@@ -11,10 +11,11 @@ import langchain
 
 # pinecone makes network requests when imported
 import pinecone
-from langchain.cache import RedisCache
+from langchain.cache import RedisCache, SQLiteCache
 from redis import Redis
 from redis_om import Migrator, checks
 
+from summ.cache.backend import SQLiteBackend, get_backend
 from summ.pipeline import Pipeline as Pipeline
 from summ.summ import Summ as Summ
 
@@ -24,14 +25,19 @@ if pinecone_api_key := os.environ.get("PINECONE_API_KEY"):
         environment=os.environ.get("PINECONE_ENVIRONMENT", "us-west1-gcp"),
     )
 
-langchain.llm_cache = RedisCache(redis_=Redis(db=1))
-
-try:
-    if not checks.has_redisearch():
-        raise TypeError
-except TypeError as e:
-    raise Exception(
-        "Redisearch not installed. Try `brew reinstall yasyf/summ/redis-stack"
-    ) from e
+if isinstance(get_backend(), SQLiteBackend):
+    langchain.llm_cache = SQLiteCache(
+        database_path=str(get_backend().path.with_suffix(".langchain.sqlite3"))
+    )
 else:
-    Migrator().run()
+    langchain.llm_cache = RedisCache(redis_=Redis(db=1))
+
+    try:
+        if not checks.has_redisearch():
+            raise TypeError
+    except TypeError as e:
+        raise Exception(
+            "Redisearch not installed. Try `brew reinstall yasyf/summ/redis-stack"
+        ) from e
+    else:
+        Migrator().run()
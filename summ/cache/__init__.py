@@ -1 +1,9 @@
-from .cacher import CacheDocument, CacheItem, ChainCacheItem
+from .backend import (
+    CacheBackend,
+    RedisBackend,
+    SQLiteBackend,
+    get_backend,
+    set_backend,
+)
+from .cacher import CacheDocument, CacheItem, ChainCacheItem, StoredDocument
+from .lru import CacheStats, LRUCache, lru
@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from functools import cached_property
+from itertools import islice
+from pathlib import Path
+from threading import RLock
+from typing import Iterable, Optional
+
+import redis
+from redis.commands.json.path import Path as JsonPath
+from redis_om import get_redis_connection
+
+from summ.cache.lru import lru
+
+
+class CacheBackend(ABC):
+    """The storage engine behind every [`CacheItem`][summ.cache.CacheItem].
+
+    Items are stored as JSON documents, under the same keys that redis-om would use.
+    """
+
+    name: str
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> list[Optional[dict]]:
+        """Fetches a set of documents, with `None` for those not found."""
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_many(self, items: list[tuple[str, dict]]):
+        """Stores a set of documents, replacing any with the same keys."""
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_many(self, keys: list[str]) -> int:
+        """Removes a set of documents, returning how many existed."""
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def keys(self, prefix: str) -> Iterable[str]:
+        """Yields every stored key starting with `prefix`."""
+
+        raise NotImplementedError
+
+    def scan(self, prefix: str, batch_size: int = 500) -> Iterable[tuple[str, dict]]:
+        """Yields every stored key starting with `prefix`, with its document, in batches."""
+
+        keys = list(self.keys(prefix))
+        for i in range(0, len(keys), batch_size):
+            batch = keys[i : i + batch_size]
+            for key, doc in zip(batch, self.get_many(batch)):
+                if doc is not None:
+                    yield key, doc
+
+
+class RedisBackend(CacheBackend):
+    """Stores items in a Redis Stack server, with RedisJSON."""
+
+    name = "redis"
+
+    def __init__(self, db: Optional[redis.Redis] = None):
+        self._db = db
+
+    @cached_property
+    def db(self) -> redis.Redis:
+        return self._db or get_redis_connection()
+
+    def get_many(self, keys: list[str]) -> list[Optional[dict]]:
+        if not keys:
+            return []
+        return self.db.json().mget(keys, JsonPath.root_path())
+
+    def set_many(self, items: list[tuple[str, dict]]):
+        pipeline = self.db.pipeline(transaction=False)
+        for key, doc in items:
+            pipeline.json().set(key, JsonPath.root_path(), doc)
+        pipeline.execute()
+
+    def delete_many(self, keys: list[str]) -> int:
+        return self.db.delete(*keys) if keys else 0
+
+    def keys(self, prefix: str) -> Iterable[str]:
+        for key in self.db.scan_iter(f"{prefix}*", _type="ReJSON-RL"):
+            yield key.decode() if isinstance(key, bytes) else key
+
+
+class SQLiteBackend(CacheBackend):
+    """Stores items in a local SQLite file, indexed by key.
+
+    Needs no external service, so it suits single-node runs and CI.
+    """
+
+    name = "sqlite"
+
+    BATCH_SIZE = 500
+    """The maximum number of keys bound to a single statement."""
+
+    def __init__(self, path: Path):
+        """Opens (or creates) a cache file.
+
+        Args:
+            path: The SQLite database to store items in.
+        """
+
+        self.path = path
+        self.lock = RLock()
+
+    @cached_property
+    def conn(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID"
+        )
+        return conn
+
+    @staticmethod
+    def _batches(keys: list[str], size: int) -> Iterable[list[str]]:
+        it = iter(keys)
+        while batch := list(islice(it, size)):
+            yield batch
+
+    def get_many(self, keys: list[str]) -> list[Optional[dict]]:
+        found: dict[str, str] = {}
+        with self.lock:
+            for batch in self._batches(keys, self.BATCH_SIZE):
+                found.update(
+                    self.conn.execute(
+                        f"SELECT key, value FROM items WHERE key IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                )
+        return [json.loads(found[k]) if k in found else None for k in keys]
+
+    def set_many(self, items: list[tuple[str, dict]]):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO items (key, value) VALUES (?, ?)",
+                [(key, json.dumps(doc)) for key, doc in items],
+            )
+
+    def delete_many(self, keys: list[str]) -> int:
+        deleted = 0
+        with self.lock, self.conn:
+            for batch in self._batches(keys, self.BATCH_SIZE):
+                deleted += self.conn.execute(
+                    f"DELETE FROM items WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).rowcount
+        return deleted
+
+    def keys(self, prefix: str) -> Iterable[str]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key FROM items WHERE key >= ? AND key < ?",
+                (prefix, prefix + "\uffff"),
+            ).fetchall()
+        return (key for key, in rows)
+
+
+_backend: Optional[CacheBackend] = None
+_lock = RLock()
+
+
+def from_env() -> CacheBackend:
+    """Builds the backend named by `SUMM_CACHE_BACKEND` (`redis` or `sqlite`).
+
+    The SQLite file defaults to `~/.cache/summ/cache.sqlite3`, and can be set with `SUMM_CACHE_PATH`.
+    """
+
+    match name := os.environ.get("SUMM_CACHE_BACKEND", RedisBackend.name):
+        case RedisBackend.name:
+            return RedisBackend()
+        case SQLiteBackend.name:
+            default = Path.home() / ".cache" / "summ" / "cache.sqlite3"
+            return SQLiteBackend(Path(os.environ.get("SUMM_CACHE_PATH", default)))
+        case _:
+            raise ValueError(f"Unknown cache backend: {name}")
+
+
+def get_backend() -> CacheBackend:
+    """The backend shared by every `CacheItem`."""
+
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = from_env()
+        return _backend
+
+
+def set_backend(backend: CacheBackend):
+    """Replaces the backend shared by every `CacheItem`."""
+
+    global _backend
+    with _lock:
+        _backend = backend
+        lru.clear()
@@ -1,14 +1,26 @@
 import json
 import types
 from abc import abstractmethod
-from typing import Optional, Self, Union, cast
+from functools import lru_cache
+from typing import Iterable, Optional, Self, Sequence, cast
 
 import metrohash
 from langchain.docstore.document import Document
-from pydantic import Field
-from redis_om import EmbeddedJsonModel, JsonModel, NotFoundError
+from pydantic import Field, root_validator
+from redis_om import EmbeddedJsonModel, JsonModel, NotFoundError, RedisModel
 from typing_extensions import override
 
+from summ.cache.backend import RedisBackend, get_backend
+from summ.cache.lru import lru
+
+
+def _init(model: JsonModel, **data):
+    if isinstance(get_backend(), RedisBackend):
+        JsonModel.__init__(model, **data)
+    else:
+        # Skips redis-om's check for a RedisJSON server.
+        RedisModel.__init__(model, **data)
+
 
 class CacheDocument(EmbeddedJsonModel):
     """A serializable version of a Document."""
@@ -16,6 +28,9 @@ class CacheDocument(EmbeddedJsonModel):
     page_content: str
     metadata: dict = Field(default_factory=dict)
 
+    def __init__(__pydantic_self__, **data):
+        _init(__pydantic_self__, **data)
+
     @classmethod
     def from_doc(cls, doc: Document):
         for k, v in doc.metadata.items():
@@ -25,29 +40,140 @@ class CacheDocument(EmbeddedJsonModel):
 
 
 class CacheItem(JsonModel):
-    """A base class for cached responses."""
+    """A base class for cached responses.
+
+    Items are stored by the shared [`CacheBackend`][summ.cache.backend.CacheBackend]
+    (Redis by default), behind an in-process LRU tier.
+    """
+
+    def __init__(__pydantic_self__, **data):
+        _init(__pydantic_self__, **data)
 
     @classmethod
-    def passthrough(cls, **kwargs) -> Self:
+    def passthrough(cls, fallbacks: Sequence[str] = (), **kwargs) -> Self:
+        """Returns the cached item for these fields, or saves (and returns) a placeholder.
+
+        Args:
+            fallbacks: The keys this item had under older key schemes. The first item found
+                there is moved to its current key.
+        """
+
         instance = cls.construct(**kwargs)
         instance.pk = cls.make_pk(instance)
-        if cached := cls.safe_get(instance.pk):
+        cached, *legacy = cls.get_many([instance.pk, *fallbacks])
+        if cached:
             return cached
+        elif old := next((i for i in legacy if i and i.is_complete()), None):
+            migrated = old.copy(update=kwargs)
+            try:
+                migrated.save()
+            except Exception:
+                return migrated
+            cls.purge([old.pk])
+            return migrated
 
-        for k in cls.__fields__.keys() - kwargs.keys():
-            setattr(instance, k, None)
+        for k, field in cls.__fields__.items():
+            if k not in kwargs and k != "pk":
+                setattr(instance, k, None if field.required else field.get_default())
 
         try:
             return cast(Self, instance.save())
         except Exception:
             return instance
 
+    @classmethod
+    def get(cls, pk: str) -> Self:
+        if (item := cls.get_many([pk])[0]) is None:
+            raise NotFoundError
+        return item
+
     @classmethod
     def safe_get(cls, pk: Optional[str]) -> Optional[Self]:
-        try:
-            return cast(Self, cls.get(pk))
-        except NotFoundError:
-            return None
+        return cls.get_many([pk])[0] if pk else None
+
+    @classmethod
+    def get_many(cls, pks: Iterable[str]) -> list[Optional[Self]]:
+        """Fetches a set of items at once, with a single round trip for those not held in-process.
+
+        Returns:
+            The items, in the order of `pks` (with `None` for those not found).
+        """
+
+        pks = list(pks)
+        items: list[Optional[Self]] = [
+            cast(Self, hit.copy(deep=True))
+            if (hit := lru.get((cls.__name__, pk)))
+            else None
+            for pk in pks
+        ]
+        if missing := [i for i, item in enumerate(items) if item is None]:
+            keys = [cls.make_primary_key(pks[i]) for i in missing]
+            for i, doc in zip(missing, get_backend().get_many(keys)):
+                if doc is not None:
+                    items[i] = item = cast(Self, cls.parse_obj(doc))
+                    item._remember()
+        return items
+
+    @classmethod
+    def save_many(cls, items: Sequence[Self]) -> Sequence[Self]:
+        """Saves a set of items at once, with a single round trip."""
+
+        if not items:
+            return items
+        for item in items:
+            item.pk = item.make_pk(item)
+            item.check()
+        get_backend().set_many(
+            [(item.key(), json.loads(item.json())) for item in items]
+        )
+        for item in items:
+            item._remember()
+        return items
+
+    @classmethod
+    def delete(cls, pk: str) -> int:
+        return cls.purge([pk])
+
+    @classmethod
+    def purge(cls, pks: Iterable[str], batch_size: int = 500) -> int:
+        """Deletes a set of items in batches, returning how many existed."""
+
+        deleted, pks = 0, list(pks)
+        for i in range(0, len(pks), batch_size):
+            batch = pks[i : i + batch_size]
+            for pk in batch:
+                lru.discard((cls.__name__, pk))
+            deleted += get_backend().delete_many(
+                [cls.make_primary_key(pk) for pk in batch]
+            )
+        return deleted
+
+    @classmethod
+    def all_pks(cls) -> Iterable[str]:
+        prefix = cls.make_primary_key("")
+        return (key.removeprefix(prefix) for key in get_backend().keys(prefix))
+
+    def is_complete(self) -> bool:
+        """Whether every required field is set (i.e. this is not a placeholder)."""
+
+        return all(
+            getattr(self, k, None) is not None
+            for k, field in self.__fields__.items()
+            if field.required
+        )
+
+    def _remember(self):
+        """Keeps a copy of this item in the in-process tier.
+
+        Placeholders (saved by `passthrough` before their result is known) are skipped,
+        since another process may fill them in.
+        """
+
+        if not self.is_complete():
+            return
+        lru.put(
+            (self.__class__.__name__, self.pk), self.copy(deep=True), len(self.json())
+        )
 
     @staticmethod
     def _hash(s: str):
@@ -59,9 +185,51 @@ class CacheItem(JsonModel):
         raise NotImplementedError
 
     @override
-    def save(self, *args, **kwargs) -> "JsonModel":
-        self.pk = self.make_pk(self)
-        return super().save(*args, **kwargs)
+    def save(self) -> Self:
+        return self.save_many([self])[0]
+
+
+@lru_cache(maxsize=4096)
+def _content_hash(text: str) -> str:
+    return CacheItem._hash(text)
+
+
+class StoredDocument(CacheItem):
+    """A Document, stored once and referenced by the hash of its contents.
+
+    Cache items hold references to these, rather than their own copies.
+    """
+
+    page_content: str
+    metadata: dict = Field(default_factory=dict)
+
+    @classmethod
+    def ref(cls, page_content: str, metadata: dict = {}) -> str:
+        """The key of a document with this content (and metadata)."""
+
+        key = _content_hash(page_content)
+        if metadata:
+            key = cls._hash(key + json.dumps(metadata, sort_keys=True))
+        return key
+
+    @classmethod
+    def make_pk(cls, instance: Self) -> str:
+        return cls.ref(instance.page_content, instance.metadata)
+
+    @classmethod
+    def from_doc(cls, doc: Document, metadata: bool = True) -> Self:
+        """Creates a stored copy of a Document, with or without its metadata."""
+
+        if not metadata:
+            return cls(page_content=doc.page_content)
+        copy = CacheDocument.from_doc(
+            Document(
+                page_content=doc.page_content,
+                # Embeddings are stored on their own.
+                metadata={k: v for k, v in doc.metadata.items() if k != "embeddings"},
+            )
+        )
+        return cls(**json.loads(copy.json(include={"page_content", "metadata"})))
 
 
 class ChainCacheItem(CacheItem):
@@ -69,24 +237,98 @@ class ChainCacheItem(CacheItem):
 
     klass: str
     name: str
-    document: Union[CacheDocument, list[CacheDocument]]
+    documents: list[str]
+    """References to the [`StoredDocument`][summ.cache.cacher.StoredDocument]s the chain was run on."""
     result: str
     meta: dict = Field(default_factory=dict)
+    prompt: str = ""
+    """A fingerprint of the prompt templates the chain was run with."""
+    created: float = 0.0
+    """When the result was saved, as a unix timestamp (zero for older items)."""
+
+    @root_validator(pre=True)
+    def _upgrade(cls, values: dict) -> dict:
+        # Items written before documents were stored separately held their own copies.
+        if "documents" not in values and (document := values.pop("document", None)):
+            values["documents"] = [
+                StoredDocument.ref(d["page_content"])
+                for d in (document if isinstance(document, list) else [document])
+            ]
+        return values
 
-    def page_contents(self) -> list[str]:
-        if isinstance(self.document, list):
-            return [doc.page_content for doc in self.document]
-        return [self.document.page_content]
+    @staticmethod
+    def stage(klass: str, name: str) -> str:
+        return f"{klass}.{name}"
 
     @classmethod
     def make_pk(cls, instance: Self) -> str:
-        return cls._hash(
+        # Keys are grouped by stage, so that a stage can be invalidated by prefix.
+        return f"{cls.stage(instance.klass, instance.name)}:" + cls._hash(
             ":".join(
                 [
                     instance.klass,
                     instance.name,
-                    *instance.page_contents(),
+                    instance.prompt,
+                    *instance.documents,
                     json.dumps(instance.meta, sort_keys=True),
                 ]
             )
         )
+
+    @classmethod
+    def unscoped_pk(
+        cls, klass: str, name: str, documents: list[str], meta: dict
+    ) -> str:
+        """The key an item had before keys held the prompt and were grouped by stage."""
+
+        return cls._hash(
+            ":".join([klass, name, *documents, json.dumps(meta, sort_keys=True)])
+        )
+
+    @classmethod
+    def invalidate(
+        cls,
+        klass: str,
+        name: Optional[str] = None,
+        legacy: bool = False,
+        batch_size: int = 500,
+    ) -> int:
+        """Deletes every cached result of a chain class, or of one of its stages.
+
+        Args:
+            klass: The name of the chain class (such as `Summarizer`).
+            name: The name of the stage (such as `summarize_doc`), or `None` for all of them.
+            legacy: Whether to also delete matching items saved under older key schemes.
+                These are not grouped by stage, so finding them reads every ungrouped item.
+            batch_size: The number of items to fetch at once, when `legacy` is set.
+
+        Returns:
+            The number of items deleted.
+        """
+
+        backend, root = get_backend(), cls.make_primary_key("")
+        prefix = cls.make_primary_key(f"{klass}." + (f"{name}:" if name else ""))
+        pks = [key.removeprefix(root) for key in backend.keys(prefix)]
+
+        if legacy:
+            old = [key for key in backend.keys(root) if ":" not in key[len(root) :]]
+            for i in range(0, len(old), batch_size):
+                batch = old[i : i + batch_size]
+                pks.extend(
+                    key.removeprefix(root)
+                    for key, doc in zip(batch, backend.get_many(batch))
+                    if doc
+                    and doc.get("klass") == klass
+                    and name in (None, doc.get("name"))
+                )
+        return cls.purge(pks, batch_size=batch_size)
+
+    @classmethod
+    def legacy_pk(
+        cls, klass: str, name: str, page_contents: list[str], meta: dict
+    ) -> str:
+        """The key an item had before documents were stored separately."""
+
+        return cls._hash(
+            ":".join([klass, name, *page_contents, json.dumps(meta, sort_keys=True)])
+        )
@@ -0,0 +1,238 @@
+import json
+from functools import partial
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from langchain.docstore.document import Document
+from pydantic import BaseModel, Field
+
+from summ.cache.backend import get_backend
+from summ.cache.cacher import CacheItem, ChainCacheItem, StoredDocument
+from summ.classify.classifier import Classifier
+from summ.embed.embedder import Embedding
+
+if TYPE_CHECKING:
+    from summ.pipeline import Pipeline
+
+
+class Collected(BaseModel):
+    """The outcome of collecting one type of cache item."""
+
+    scanned: int = 0
+    deleted: int = 0
+    bytes: int = 0
+    """The (serialized) size of the deleted items."""
+
+
+class CollectReport(BaseModel):
+    types: dict[str, Collected] = Field(default_factory=dict)
+    dry_run: bool = False
+
+    def report(self) -> str:
+        verb = "would be deleted" if self.dry_run else "deleted"
+        return "\n".join(
+            f"{name}: {c.deleted}/{c.scanned} {verb} ({c.bytes} bytes)"
+            for name, c in self.types.items()
+        )
+
+
+class Collector:
+    """Deletes cache items which are no longer reachable from the corpus or the index.
+
+    - Embeddings are live if the manifest (or the journal of an unfinished run) holds their ids.
+    - Results of the populate stages (factify, summarize, classify and query generation)
+      are live if the current corpus would look them up. Placeholders are never live.
+    - Stored documents are live if any remaining item references them.
+
+    Results of other chains (such as those cached by queries) are only removed by the
+    memory budget, oldest first. Do not run this while the pipeline is running.
+    """
+
+    def __init__(self, pipe: "Pipeline", batch_size: int = 500):
+        """Creates a new Collector.
+
+        Args:
+            pipe: The pipeline which populates the cache, used to find the live corpus.
+            batch_size: The number of items to fetch or delete at once.
+        """
+
+        self.pipe = pipe
+        self.batch_size = batch_size
+
+    def _scan(self, cls: type[CacheItem]) -> Iterable[tuple[str, dict]]:
+        """Yields the raw (unparsed) documents of every item of a type."""
+
+        for key, doc in get_backend().scan(cls.make_primary_key(""), self.batch_size):
+            yield doc.get("pk") or key.rsplit(":", 1)[-1], doc
+
+    def _stages(self) -> set[tuple[str, str]]:
+        return {
+            (self.pipe.factifier.__class__.__name__, "factify"),
+            (self.pipe.summarizer.__class__.__name__, "summarize_doc"),
+            *((klass.__name__, "run") for klass in Classifier.classifiers.values()),
+            (self.pipe.embedder.__class__.__name__, "generate_queries"),
+            (self.pipe.embedder.__class__.__name__, "generate_query"),
+        }
+
+    def _live_file(self, docs: list[Document]) -> Iterable[str]:
+        for klass in Classifier.classifiers.values():
+            classifier = klass()
+            yield from classifier.cache_keys(
+                "run", classifier.run_chain(), docs, classifier.classify
+            )
+
+        summarizer = self.pipe.summarizer
+        chain = summarizer.summarize_doc_chain()
+        keys = [
+            summarizer.cache_keys("summarize_doc", chain, [doc], lambda x: x)
+            for doc in docs
+        ]
+        yield from (key for k in keys for key in k)
+        summaries = [
+            item.result.strip() if item and item.result else None
+            for item in self._first(keys)
+        ]
+
+        # Factify results are only reachable by following the context from the start of the file.
+        factifier = self.pipe.factifier.fork()
+        chain = factifier.factify_chain()
+        facts: list[list[str]] = []
+        for doc in docs:
+            keys = factifier.cache_keys("factify", chain, doc, factifier.inputs)
+            yield from keys
+            [item] = self._first([keys])
+            if not (item and item.result):
+                break
+            found, factifier.context = factifier.parse("- " + item.result)
+            facts.append(found)
+
+        # Generated queries are keyed on the facts and summary of their chunk.
+        embedder = self.pipe.embedder
+        chain = embedder.generate_queries_chain()
+        for doc, found, summary in zip(docs, facts, summaries):
+            if found and summary is not None:
+                doc = Document(
+                    page_content=doc.page_content,
+                    metadata={"facts": found, "summary": summary},
+                )
+                yield from embedder.cache_keys(
+                    "generate_queries", chain, doc, embedder.generate_queries_inputs
+                )
+                # Facts the batched response skipped have their own queries.
+                for fact in found:
+                    yield from embedder.cache_keys(
+                        "generate_query",
+                        embedder.query_chain,
+                        doc,
+                        partial(embedder.generate_query_inputs, fact),
+                    )
+
+    @staticmethod
+    def _first(keys: list[list[str]]) -> list[Optional[ChainCacheItem]]:
+        """The first item found under each set of keys, in a single round trip."""
+
+        items = iter(ChainCacheItem.get_many(key for k in keys for key in k))
+        return [next((i for i in [next(items) for _ in k] if i), None) for k in keys]
+
+    def live_results(self) -> set[str]:
+        """The keys of every populate stage result the current corpus would look up."""
+
+        return {
+            key
+            for docs in self.pipe._split_blobs(self.pipe.importer.blobs)
+            if docs
+            for key in self._live_file(docs)
+        }
+
+    def live_embeddings(self) -> set[str]:
+        """The ids of every embedding in the index, according to the manifest and journal."""
+
+        live: set[str] = set()
+        if manifest := self.pipe.manifest:
+            live.update(id for entry in manifest.entries.values() for id in entry.ids)
+        if journal := self.pipe.journal:
+            journal.read()
+            live.update(
+                id
+                for stages in journal.entries.values()
+                for id in stages.get("embedded", {}).get("ids", [])
+            )
+        return live
+
+    def _delete(self, cls: type[CacheItem], pks: list[str], dry_run: bool):
+        if not dry_run:
+            cls.purge(pks, batch_size=self.batch_size)
+
+    def collect(
+        self, max_bytes: Optional[int] = None, dry_run: bool = False
+    ) -> CollectReport:
+        """Deletes every unreachable item.
+
+        Args:
+            max_bytes: A budget for the size of all chain results. The oldest results are
+                evicted (even if they are live) until the rest fit.
+            dry_run: Whether to only report what would be deleted.
+        """
+
+        report = CollectReport(dry_run=dry_run)
+        if not (live := self.live_embeddings()):
+            # Without a record of the index, every embedding would look unreachable.
+            raise ValueError("The manifest is empty. Run `summ populate` first.")
+
+        # Embeddings
+        dead, docs = [], set()
+        stats = report.types[Embedding.__name__] = Collected()
+        for pk, doc in self._scan(Embedding):
+            stats.scanned += 1
+            if pk in live:
+                docs.update(doc.get("postings", {}))
+                if "doc" in doc:
+                    docs.add(doc["doc"])
+            else:
+                dead.append(pk)
+                stats.bytes += len(json.dumps(doc))
+        stats.deleted = len(dead)
+        self._delete(Embedding, dead, dry_run)
+
+        # Chain results
+        live, stages = self.live_results(), self._stages()
+        kept: list[tuple[float, int, str, list[str]]] = []
+        dead = []
+        stats = report.types[ChainCacheItem.__name__] = Collected()
+        for pk, doc in self._scan(ChainCacheItem):
+            stats.scanned += 1
+            size = len(json.dumps(doc))
+            if doc.get("result") is None or (
+                (doc.get("klass"), doc.get("name")) in stages and pk not in live
+            ):
+                dead.append(pk)
+                stats.bytes += size
+            else:
+                kept.append(
+                    (doc.get("created", 0.0), size, pk, doc.get("documents", []))
+                )
+
+        if max_bytes is not None:
+            kept.sort()
+            total = sum(size for _, size, _, _ in kept)
+            while kept and total > max_bytes:
+                _, size, pk, _ = kept.pop(0)
+                dead.append(pk)
+                stats.bytes += size
+                total -= size
+
+        docs.update(ref for *_, refs in kept for ref in refs)
+        stats.deleted = len(dead)
+        self._delete(ChainCacheItem, dead, dry_run)
+
+        # Documents
+        dead = []
+        stats = report.types[StoredDocument.__name__] = Collected()
+        for pk, doc in self._scan(StoredDocument):
+            stats.scanned += 1
+            if pk not in docs:
+                dead.append(pk)
+                stats.bytes += len(json.dumps(doc))
+        stats.deleted = len(dead)
+        self._delete(StoredDocument, dead, dry_run)
+
+        return report
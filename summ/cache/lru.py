@@ -0,0 +1,98 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import RLock
+from typing import Generic, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    items: int = 0
+    bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LRUCache(Generic[T]):
+    """A thread-safe, in-process LRU cache, bounded by both item count and total size.
+
+    Used as a tier in front of the shared cache, so that items read (or written)
+    moments earlier by the same process are served without a round trip.
+    """
+
+    def __init__(self, max_items: int, max_bytes: int):
+        """Creates a new LRUCache.
+
+        Args:
+            max_items: The maximum number of items to hold. Zero disables the cache.
+            max_bytes: The maximum total (estimated) size of the items to hold.
+        """
+
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.lock = RLock()
+        self.items: OrderedDict[Hashable, tuple[T, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @classmethod
+    def from_env(cls, prefix: str, max_items: int, max_bytes: int):
+        return cls(
+            max_items=int(os.environ.get(f"{prefix}_ITEMS", max_items)),
+            max_bytes=int(os.environ.get(f"{prefix}_BYTES", max_bytes)),
+        )
+
+    def get(self, key: Hashable) -> Optional[T]:
+        with self.lock:
+            if (entry := self.items.get(key)) is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: T, size: int):
+        with self.lock:
+            self.discard(key)
+            if not self.max_items or size > self.max_bytes:
+                return
+            self.items[key] = (value, size)
+            self.bytes += size
+            while len(self.items) > self.max_items or self.bytes > self.max_bytes:
+                _, (_, evicted) = self.items.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def discard(self, key: Hashable):
+        with self.lock:
+            if (entry := self.items.pop(key, None)) is not None:
+                self.bytes -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.bytes = 0
+
+    def stats(self) -> CacheStats:
+        with self.lock:
+            return CacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                items=len(self.items),
+                bytes=self.bytes,
+            )
+
+
+lru: LRUCache = LRUCache.from_env(
+    "SUMM_CACHE_LRU", max_items=50_000, max_bytes=256 * 1024 * 1024
+)
+"""The in-process tier shared by every `CacheItem` (configurable with `SUMM_CACHE_LRU_ITEMS` and `SUMM_CACHE_LRU_BYTES`)."""
@@ -0,0 +1,112 @@
+import gzip
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional
+
+from summ.cache.backend import get_backend
+from summ.cache.cacher import CacheItem, ChainCacheItem, StoredDocument
+from summ.embed.embedder import Embedding
+
+TYPES: dict[str, type[CacheItem]] = {
+    cls.__name__: cls for cls in (ChainCacheItem, Embedding, StoredDocument)
+}
+"""The item types which can be exported, by name."""
+
+
+def _refs(doc: dict) -> list[str]:
+    # Items written before documents were stored separately hold their own copies.
+    if "documents" in doc:
+        return doc["documents"]
+    refs = list(doc.get("postings", {}))
+    return refs + [doc["doc"]] if isinstance(doc.get("doc"), str) else refs
+
+
+def export_items(
+    path: Path,
+    klasses: Optional[Iterable[str]] = None,
+    names: Optional[Iterable[str]] = None,
+    embeddings: bool = True,
+    batch_size: int = 500,
+) -> Counter[str]:
+    """Streams cached items to a gzipped file of JSON lines.
+
+    The documents which exported items reference are exported with them, so that the
+    file loads into an empty cache.
+
+    Args:
+        path: The file to write.
+        klasses: Only export the chain results of these classes (such as `Factifier`).
+        names: Only export the chain results of these stages (such as `factify`).
+        embeddings: Whether to export embeddings.
+        batch_size: The number of items to fetch at once.
+
+    Returns:
+        The number of items exported, by type.
+    """
+
+    backend, counts, refs = get_backend(), Counter[str](), set[str]()
+    klasses, names = set(klasses or ()), set(names or ())
+
+    def write(f, cls: type[CacheItem], doc: dict):
+        f.write(json.dumps([cls.__name__, doc]) + "\n")
+        counts[cls.__name__] += 1
+
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for _, doc in backend.scan(ChainCacheItem.make_primary_key(""), batch_size):
+            if doc.get("result") is None:
+                continue
+            if klasses and doc.get("klass") not in klasses:
+                continue
+            if names and doc.get("name") not in names:
+                continue
+            write(f, ChainCacheItem, doc)
+            refs.update(_refs(doc))
+
+        if embeddings:
+            for _, doc in backend.scan(Embedding.make_primary_key(""), batch_size):
+                write(f, Embedding, doc)
+                refs.update(_refs(doc))
+
+        keys = [StoredDocument.make_primary_key(ref) for ref in sorted(refs)]
+        for i in range(0, len(keys), batch_size):
+            for doc in backend.get_many(keys[i : i + batch_size]):
+                if doc is not None:
+                    write(f, StoredDocument, doc)
+
+    return counts
+
+
+def import_items(path: Path, batch_size: int = 1000) -> Counter[str]:
+    """Loads a file written by [`export_items`][summ.cache.transfer.export_items] into the cache.
+
+    Items are written in batches, replacing any with the same keys.
+
+    Args:
+        path: The file to read.
+        batch_size: The number of items to write at once.
+
+    Returns:
+        The number of items imported, by type.
+    """
+
+    backend, counts = get_backend(), Counter[str]()
+    batch: list[tuple[str, dict]] = []
+
+    def flush():
+        backend.set_many(batch)
+        batch.clear()
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            name, doc = json.loads(line)
+            if (cls := TYPES.get(name)) is None:
+                raise ValueError(f"Unknown item type: {name}")
+            batch.append((cls.make_primary_key(doc["pk"]), doc))
+            counts[name] += 1
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+
+    return counts
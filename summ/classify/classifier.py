@@ -109,12 +109,14 @@ class Classifier(ABC, Generic[C], Chain):
             c for result in results.split(",") for c in [self.classes.get(result)] if c
         ]
 
+    def run_chain(self) -> LLMChain:
+        return LLMChain(llm=self.llm, prompt=self.prompt_template())
+
     def run(self, docs: list[Document]) -> list[C]:
         """Runs a Document through the classifier and returns the tags."""
-        chain = LLMChain(llm=self.llm, prompt=self.prompt_template())
         results = self.cached(
             "run",
-            chain,
+            self.run_chain(),
             docs,
             self.classify,
         )
@@ -5,11 +5,14 @@ import signal
 import sys
 import warnings
 from pathlib import Path
+from typing import Optional
 
 import click
 import langchain
 from pydantic import BaseModel
 
+from summ.cache.cacher import ChainCacheItem
+from summ.cache.transfer import export_items, import_items
 from summ.classify import Classes, Classifier
 from summ.cli.app import SummApp
 from summ.pipeline import Pipeline
@@ -46,7 +49,7 @@ class CLI:
                 summ = Summ(index="rpa-user-interviews")
 
                 path = Path(__file__).parent.parent / "interviews"
-                pipe = Pipeline.default(path, summ.index)
+                pipe = Pipeline.default(path, summ.index, summ.provider)
                 pipe.splitter = OtterSplitter(speakers_to_exclude=["markie"])
 
                 CLI.run(summ, pipe)
@@ -81,11 +84,105 @@ class CLI:
                 SummApp(summ, pipe, is_demo=is_demo).run()
 
         @cli.command()
+        @click.option(
+            "--force/--no-force",
+            default=False,
+            help="Re-process files that are unchanged since the last run.",
+        )
+        @click.option(
+            "--resume/--no-resume",
+            default=False,
+            help="Continue an interrupted run, skipping any work it completed.",
+        )
+        @click.option(
+            "--dry-run",
+            is_flag=True,
+            default=False,
+            help="Estimate the calls, tokens and time needed, without running anything.",
+        )
         @click.pass_context
-        def populate(ctx: click.Context):
+        def populate(ctx: click.Context, force: bool, resume: bool, dry_run: bool):
+            if dry_run:
+                click.echo(summ.estimate(Path(pipe.importer.dir), pipe=pipe).report())
+                return
             summ.populate(
-                Path(pipe.importer.dir), pipe=pipe, parallel=not ctx.obj.verbose
+                Path(pipe.importer.dir),
+                pipe=pipe,
+                parallel=not ctx.obj.verbose,
+                force=force,
+                resume=resume,
+            )
+
+        @cli.group()
+        def cache():
+            pass
+
+        @cache.command()
+        @click.option(
+            "--max-bytes",
+            type=int,
+            default=None,
+            help="Evict the oldest cached results until they fit in this many bytes.",
+        )
+        @click.option(
+            "--dry-run",
+            is_flag=True,
+            default=False,
+            help="Only report what would be deleted.",
+        )
+        def gc(max_bytes: Optional[int], dry_run: bool):
+            report = summ.gc(
+                Path(pipe.importer.dir), pipe=pipe, max_bytes=max_bytes, dry_run=dry_run
             )
+            click.echo(report.report())
+
+        @cache.command()
+        @click.argument("path", type=click.Path(dir_okay=False, path_type=Path))
+        @click.option(
+            "--klass",
+            multiple=True,
+            help="Only export the results of this chain class (e.g. Factifier).",
+        )
+        @click.option(
+            "--name",
+            multiple=True,
+            help="Only export the results of this stage (e.g. factify).",
+        )
+        @click.option(
+            "--embeddings/--no-embeddings",
+            default=True,
+            help="Whether to export embeddings.",
+        )
+        def export(path: Path, klass: tuple[str], name: tuple[str], embeddings: bool):
+            counts = export_items(
+                path, klasses=klass, names=name, embeddings=embeddings
+            )
+            for type_, n in counts.items():
+                click.echo(f"{type_}: {n} exported")
+
+        @cache.command()
+        @click.argument("stages", nargs=-1, required=True)
+        @click.option(
+            "--legacy",
+            is_flag=True,
+            default=False,
+            help="Also delete results saved under older key schemes (scans the whole cache).",
+        )
+        def invalidate(stages: tuple[str], legacy: bool):
+            """Deletes the cached results of STAGES, given as Class or Class.name
+            (e.g. Summarizer.summarize_doc)."""
+            for stage in stages:
+                klass, _, name = stage.partition(".")
+                n = ChainCacheItem.invalidate(klass, name or None, legacy=legacy)
+                click.echo(f"{stage}: {n} invalidated")
+
+        @cache.command("import")
+        @click.argument(
+            "path", type=click.Path(exists=True, dir_okay=False, path_type=Path)
+        )
+        def import_(path: Path):
+            for type_, n in import_items(path).items():
+                click.echo(f"{type_}: {n} imported")
 
         class_options = set(
             itertools.chain.from_iterable(
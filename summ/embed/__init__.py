@@ -1 +1,2 @@
 from .embedder import Embedder, Embedding
+from .provider import EmbeddingProvider, HashingProvider, OpenAIProvider
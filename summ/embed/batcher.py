@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
+from threading import BoundedSemaphore, Lock, Thread
+from typing import Optional
+
+from langchain.embeddings.base import Embeddings
+
+from summ.shared.limiter import retry_transient
+
+
+class EmbeddingBatcher:
+    """Gathers embedding requests from every thread into batched API calls.
+
+    A batch is sent once it holds `max_size` texts, or once its oldest text has waited
+    `max_wait` seconds, whichever comes first. Up to `max_inflight` batches are sent at once.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_size: int = 256,
+        max_wait: float = 0.05,
+        max_inflight: int = 4,
+    ):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.max_inflight = max_inflight
+        self.queue: Queue[tuple[str, Future[list[float]]]] = Queue()
+        self.lock = Lock()
+        self.slots = BoundedSemaphore(max_inflight)
+        self._thread: Optional[Thread] = None
+
+    def submit(self, text: str) -> Future[list[float]]:
+        """Queues a text to be embedded in the next batch."""
+
+        future: Future[list[float]] = Future()
+        self.queue.put((text, future))
+        self._start()
+        return future
+
+    def embed(self, text: str) -> list[float]:
+        """Embeds a single text, blocking until its batch returns."""
+
+        return self.submit(text).result()
+
+    def _start(self):
+        with self.lock:
+            if not self._thread:
+                self._thread = Thread(
+                    target=self._run, name="summ-embed-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _next_batch(self) -> list[tuple[str, Future[list[float]]]]:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_size:
+            try:
+                batch.append(
+                    self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                )
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        with ThreadPoolExecutor(self.max_inflight) as pool:
+            while True:
+                # Wait for a free slot first, so the next batch grows in the meantime.
+                self.slots.acquire()
+                pool.submit(self._flush, self._next_batch())
+
+    @retry_transient()
+    def _embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def _flush(self, batch: list[tuple[str, Future[list[float]]]]):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = dict(zip(texts, self._embed_documents(texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for text, future in batch:
+                future.set_result(vectors[text])
+        finally:
+            self.slots.release()
@@ -1,41 +1,176 @@
+import base64
 import itertools
-from functools import cached_property
-from typing import Generator, Self
+import logging
+import re
+from concurrent.futures import Future
+from functools import cached_property, partial
+from threading import RLock
+from typing import Generator, Optional, Self, Sequence, cast
 
-import pinecone
+import numpy as np
 from langchain import LLMChain, OpenAI, PromptTemplate
 from langchain.docstore.document import Document
-from langchain.embeddings import OpenAIEmbeddings
-from openai.error import RateLimitError
-from retry import retry
+from pydantic import Field, root_validator
 
-from summ.cache.cacher import CacheDocument, CacheItem
+from summ.cache.cacher import CacheDocument, CacheItem, StoredDocument
+from summ.embed.batcher import EmbeddingBatcher
+from summ.embed.provider import EmbeddingProvider, OpenAIProvider
+from summ.embed.provider import from_env as provider_from_env
+from summ.embed.store import get_store
+from summ.embed.writer import Vector, VectorWriter
+from summ.shared.chain import Chain
 from summ.shared.utils import dedent
 
 
 class Embedding(CacheItem):
     """A serializable embedding vector, representing a query.
 
-    Always has an associated fact."""
+    Always has an associated fact. Queries which only differ in case or whitespace
+    share a single embedding, which lists every document they came from."""
 
-    document: CacheDocument
+    doc: str
+    """A reference to the first [`StoredDocument`][summ.cache.cacher.StoredDocument] the fact came from."""
+    postings: dict[str, list[str]] = Field(default_factory=dict)
+    """References to every document the fact came from, with the classes of each."""
+    chunks: dict[str, str] = Field(default_factory=dict)
+    """The document each chunk (as `file:chunk`) last posted, so that new versions replace old ones."""
     query: str
     fact: str
-    embedding: list[float]
+    vector: str
+    """The embedding, packed as base64-encoded little-endian floats of `dtype`."""
+    dtype: str = "float32"
+    scope: str = ""
+    """The [`scope`][summ.embed.provider.EmbeddingProvider.scope] of the provider which made the vector."""
+    document: Optional[CacheDocument] = None
+    """The source document itself, only set on items written before documents were stored separately."""
+
+    @root_validator(pre=True)
+    def _upgrade(cls, values: dict) -> dict:
+        # Items written before documents were stored separately held their own copies.
+        if "doc" not in values and isinstance(document := values.get("document"), dict):
+            values["doc"] = StoredDocument.ref(
+                document["page_content"], document.get("metadata", {})
+            )
+        # Items written before vectors were packed held a list of floats.
+        if "vector" not in values and isinstance(
+            embedding := values.pop("embedding", None), list
+        ):
+            values["vector"] = cls.pack(embedding)
+        return values
+
+    @staticmethod
+    def pack(embedding: Sequence[float], dtype: str = "float32") -> str:
+        """Packs an embedding into the compact form it is stored in."""
+
+        array = np.asarray(embedding, dtype=np.dtype(dtype).newbyteorder("<"))
+        return base64.b64encode(array.tobytes()).decode()
+
+    @property
+    def embedding(self) -> np.ndarray:
+        """The embedding, decoded without copying into a (read-only) array."""
+
+        return np.frombuffer(
+            base64.b64decode(self.vector), dtype=np.dtype(self.dtype).newbyteorder("<")
+        )
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.split()).casefold()
+
+    @classmethod
+    def query_pk(cls, query: str, scope: str = "") -> str:
+        """The key of the embedding for a query, made by the provider with this `scope`."""
+
+        key = cls._hash(cls.normalize(query))
+        return f"{scope}:{key}" if scope else key
+
+    @classmethod
+    def legacy_pk(cls, query: str) -> str:
+        """The key an embedding had before queries were normalized."""
+
+        return cls._hash(query)
 
     @classmethod
     def make_pk(cls, instance: Self) -> str:
-        return cls._hash(instance.query)
+        return cls.query_pk(instance.query, instance.scope)
+
+    @staticmethod
+    def chunk_of(doc: Document) -> Optional[str]:
+        """The stable name of the chunk a document was split from, if it has one."""
+
+        if "file" in doc.metadata and "chunk" in doc.metadata:
+            return f"{doc.metadata['file']}:{doc.metadata['chunk']}"
+        return None
+
+    def post(self, ref: str, classes: list[str], chunk: Optional[str] = None):
+        """Adds a document to the postings, replacing the one its chunk posted before."""
+
+        old = self.chunks.get(chunk) if chunk else None
+        if chunk:
+            self.chunks = {**self.chunks, chunk: ref}
+        self.postings = {**self.postings, ref: classes}
+        if old and old != ref:
+            self._orphan([old])
+
+    def unpost(self, chunks: list[str]) -> bool:
+        """Removes the documents posted by these chunks.
+
+        Returns:
+            Whether any were removed.
+        """
+
+        if not (dropped := [self.chunks[c] for c in chunks if c in self.chunks]):
+            return False
+        self.chunks = {c: r for c, r in self.chunks.items() if c not in chunks}
+        self._orphan(dropped)
+        return True
 
+    def _orphan(self, refs: list[str]):
+        # A document may still be posted by another chunk with the same content.
+        kept = set(self.chunks.values())
+        self.postings = {
+            r: c for r, c in self.postings.items() if r in kept or r not in refs
+        }
 
-class Embedder:
+    @property
+    def refs(self) -> list[str]:
+        return list(self.postings) or [self.doc]
+
+    @property
+    def classes(self) -> list[str]:
+        """Every class of every document the fact came from."""
+
+        return sorted(set(itertools.chain.from_iterable(self.postings.values())))
+
+    @classmethod
+    def sources(cls, embeddings: list[Self]) -> list[list[Optional[StoredDocument]]]:
+        """Resolves every source document of a set of embeddings, in a single round trip."""
+
+        stored = iter(
+            StoredDocument.get_many(
+                ref for e in embeddings if not e.document for ref in e.refs
+            )
+        )
+        return [
+            [
+                StoredDocument.construct(
+                    page_content=e.document.page_content, metadata=e.document.metadata
+                )
+            ]
+            if e.document
+            else [next(stored) for _ in e.refs]
+            for e in embeddings
+        ]
+
+
+class Embedder(Chain):
     """Embedders are responsible for taking fully-populated Documents and embedding them,
     optionally persiting them to a vector store in the process.
 
-    Currently, only Pinecone is supported.
+    The vector store is chosen by [`get_store`][summ.embed.store.get_store].
     """
 
-    GPT3_DIMS = 1536
+    GPT3_DIMS = OpenAIProvider.dims
 
     QUERIES = 1
     """The number of extra queries to generate per fact."""
@@ -53,92 +188,289 @@ class Embedder:
         ),
     )
 
+    BATCH_QUERY_TEMPLATE = PromptTemplate(
+        input_variables=["facts", "context", "n"],
+        template=dedent(
+            """
+            A user was interviewed, and stated the numbered facts below. Given each fact and the context of the interview, create {n} question(s) that the fact is the answer to. Each question should be specific to its fact.
+
+            Context: {context}
+
+            Facts:
+            {facts}
+
+            Write each question on its own line, starting with the number of the fact it is for (e.g. "1. What ...?").
+            Questions:
+            """
+        ),
+    )
+
     def create_index(self):
-        """Creates the named index in Pinecone."""
+        """Creates the named index in the vector store."""
 
-        pinecone.create_index(
-            self.index_name,
-            dimension=self.dims,
-            metadata_config={"indexed": ["classes"]},
-        )
+        self.index.create()
 
     def has_index(self):
-        """Checks if the named index in Pinecone exists."""
+        """Checks if the named index in the vector store exists."""
 
-        try:
-            pinecone.describe_index(self.index_name)
-            return True
-        except pinecone.exceptions.NotFoundException:
-            return False
+        return self.index.exists()
 
-    def __init__(self, index: str, dims: int = GPT3_DIMS):
+    def __init__(
+        self,
+        index: str,
+        dtype: str = "float32",
+        provider: Optional[EmbeddingProvider] = None,
+    ):
         """Creates a new Embedder.
 
         Args:
-            index: The name of the vector db index to use.
-            dims: The number of dimensions of the vector db index.
+            index: The name of the vector db index to use (see [`get_store`][summ.embed.store.get_store]).
+            dtype: The precision to cache vectors at (`float32`, or `float16` for half the size).
+            provider: The model to embed with, which sets the dimensions of the index.
+                Defaults to the one named by the environment (see [`from_env`][summ.embed.provider.from_env]).
         """
         super().__init__()
         self.index_name = index
-        self.dims = dims
-        self.embeddings = OpenAIEmbeddings()
-        self.index = pinecone.Index(index)
+        self.provider = provider or provider_from_env()
+        self.dims = self.provider.dims
+        self.dtype = dtype
+        self.embeddings = self.provider
+        self.batcher = EmbeddingBatcher(self.embeddings)
+        self.index = get_store(index, self.dims)
+        self.lock = RLock()
+        self.writer = VectorWriter(self.index)
+
+    def _embed(self, queries: list[tuple[str, str]], doc: Document) -> list[Embedding]:
+        scope = self.provider.scope
+        keys = [Embedding.query_pk(query, scope) for query, _ in queries]
+        distinct = dict(zip(keys, queries))
+        found = dict(zip(distinct, Embedding.get_many(distinct)))
+
+        # Embeddings saved before queries were normalized are re-saved under their new keys.
+        if not scope and (
+            missing := [k for k, e in found.items() if not (e and e.vector)]
+        ):
+            legacy = Embedding.get_many(
+                Embedding.legacy_pk(distinct[k][0]) for k in missing
+            )
+            found.update((k, e) for k, e in zip(missing, legacy) if e and e.vector)
+
+        stored, chunk = StoredDocument.from_doc(doc), Embedding.chunk_of(doc)
+        ref = StoredDocument.make_pk(stored)
+        classes = sorted(
+            set(itertools.chain.from_iterable(doc.metadata.get("classes", {}).values()))
+        )
+        stale = [
+            k
+            for k, e in found.items()
+            if not (
+                e
+                and e.postings.get(ref) == classes
+                and (not chunk or e.chunks.get(chunk) == ref)
+            )
+        ]
+        if not stale:
+            return [cast(Embedding, found[k]) for k in keys]
+
+        # Each distinct query is embedded once, however many documents it came from.
+        pending = {
+            k: self.batcher.submit(distinct[k][0])
+            for k in stale
+            if not ((e := found[k]) and e.vector)
+        }
+        for k, future in pending.items():
+            query, fact = distinct[k]
+            found[k] = Embedding.construct(
+                doc=ref,
+                query=query,
+                fact=fact,
+                vector=Embedding.pack(future.result(), self.dtype),
+                dtype=self.dtype,
+                scope=scope,
+                postings={},
+                chunks={},
+            )
+
+        with self.lock:
+            # Another document may have added its own posting in the meantime.
+            latest = Embedding.get_many(stale)
+            for k, current in zip(stale, latest):
+                embedding = current if current and current.vector else found[k]
+                embedding = cast(Embedding, embedding)
+                if not embedding.postings and embedding.doc != ref:
+                    embedding.postings = self._postings(embedding)
+                embedding.post(ref, classes, chunk)
+                found[k] = embedding
+            CacheItem.save_many([stored, *(cast(Embedding, found[k]) for k in stale)])
 
-    def _embed(self, query: str, fact: str, doc: Document) -> Embedding:
-        embedding = Embedding.passthrough(query=query)
+        return [cast(Embedding, found[k]) for k in keys]
 
-        if not embedding.embedding:
-            embedding.fact = fact
-            embedding.document = CacheDocument.from_doc(doc)
-            embedding.embedding = self.embeddings.embed_documents([query])[0]
-            embedding.save()
+    @staticmethod
+    def _postings(embedding: Embedding) -> dict[str, list[str]]:
+        """The postings of an embedding saved before they were kept, from its one document."""
 
-        return embedding
+        [doc] = Embedding.sources([embedding])[0]
+        classes = doc.metadata.get("classes", {}).values() if doc else []
+        return {embedding.doc: sorted(set(itertools.chain.from_iterable(classes)))}
 
     @cached_property
     def query_chain(self):
         return LLMChain(
-            llm=OpenAI(temperature=0.7, cache=False), prompt=self.QUERY_TEMPLATE
+            llm=OpenAI(temperature=0.7, cache=False, max_retries=1),
+            prompt=self.QUERY_TEMPLATE,
         )
 
-    @retry(exceptions=RateLimitError, tries=5, delay=6, jitter=(0, 4))
+    @staticmethod
+    def generate_query_inputs(fact: str, doc: Document) -> dict[str, str]:
+        """The prompt variables for generating a query for one fact of a document."""
+
+        return {"fact": fact, "context": doc.metadata["summary"]}
+
     def _generate_query(self, fact: str, doc: Document) -> str:
-        return self.query_chain.run(fact=fact, context=doc.metadata["summary"])
+        return self.cached(
+            "generate_query",
+            self.query_chain,
+            doc,
+            partial(self.generate_query_inputs, fact),
+        )
+
+    def generate_queries_chain(self) -> LLMChain:
+        return LLMChain(llm=self.query_chain.llm, prompt=self.BATCH_QUERY_TEMPLATE)
+
+    def generate_queries_inputs(self, doc: Document) -> dict[str, str]:
+        """The prompt variables for generating the queries of every fact in a document."""
+
+        return {
+            "facts": "\n".join(
+                f"{i}. {fact}" for i, fact in enumerate(doc.metadata["facts"], 1)
+            ),
+            "context": doc.metadata["summary"],
+            "n": str(self.QUERIES),
+        }
+
+    def parse_queries(self, results: str, facts: list[str]) -> list[list[str]]:
+        """Splits the generated questions back up by fact (dropping any beyond `QUERIES`)."""
+
+        queries: list[list[str]] = [[] for _ in facts]
+        for line in results.splitlines():
+            if (m := re.match(r"\s*(\d+)[.):]\s*(.+)", line)) and 0 < int(
+                m.group(1)
+            ) <= len(facts):
+                queries[int(m.group(1)) - 1].append(m.group(2).strip())
+        return [q[: self.QUERIES] for q in queries]
+
+    def _generate_queries(self, doc: Document) -> list[tuple[str, str]]:
+        facts = doc.metadata["facts"]
+        if not facts:
+            return []
+
+        # One (cached) request covers every fact in the document.
+        results = self.cached(
+            "generate_queries",
+            self.generate_queries_chain(),
+            doc,
+            self.generate_queries_inputs,
+        )
+        pairs = []
+        for fact, queries in zip(facts, self.parse_queries(results, facts)):
+            # Facts the response skipped are asked about one at a time (and cached,
+            # so that re-runs produce the same query).
+            if len(queries) < self.QUERIES:
+                queries.append(self._generate_query(fact, doc))
+            pairs.extend((query, fact) for query in queries)
+        return pairs
 
     def embed(
         self, doc: Document, gen_queries: bool = False
     ) -> Generator[Embedding, None, None]:
         """Yields a set of embeddings for a given document."""
 
-        for fact in doc.metadata["facts"]:
-            yield self._embed(query=fact, fact=fact, doc=doc)
-            if gen_queries:
-                for _ in range(self.QUERIES):
-                    yield self._embed(
-                        query=self._generate_query(fact, doc),
-                        fact=fact,
-                        doc=doc,
-                    )
+        facts = doc.metadata["facts"]
+        yield from self._embed([(fact, fact) for fact in facts], doc)
+        if gen_queries:
+            yield from self._embed(self._generate_queries(doc), doc)
 
-    def persist(self, doc: Document) -> list[Embedding]:
-        """Collects the set of embeddings for a Document,
-        and persists them to the vector store."""
+    def prune(self, file: str, live: dict[str, set[str]], ids: list[str]):
+        """Removes the postings of a file's chunks which no longer produce each embedding,
+        and rewrites the classes of any vectors which changed.
 
-        embeddings = list(self.embed(doc, gen_queries=True))
-        vectors = [
+        Args:
+            file: The name of the file.
+            live: The chunks (as `file:chunk`) of the file which produce each embedding.
+            ids: Every embedding in the index which the file produces, or used to produce.
+        """
+
+        with self.lock:
+            changed = []
+            for e in filter(None, Embedding.get_many(dict.fromkeys(ids))):
+                produced = live.get(e.pk, set())
+                if e.unpost(
+                    [
+                        c
+                        for c in e.chunks
+                        if c.rsplit(":", 1)[0] == file and c not in produced
+                    ]
+                ):
+                    changed.append(e)
+            if changed:
+                CacheItem.save_many(changed)
+                self.index.upsert(self._vectors(changed))
+
+    def upsert(self, embeddings: list[Embedding]) -> Future[None]:
+        """Queues a set of embeddings to be persisted to the vector store.
+
+        Returns:
+            A future which resolves once the embeddings have been written.
+        """
+
+        return self.writer.write(self._vectors(embeddings))
+
+    def _vectors(self, embeddings: list[Embedding]) -> list[Vector]:
+        embeddings = list({e.pk: e for e in embeddings}.values())
+        # Embeddings saved before postings were kept only know their first document.
+        sources = iter(Embedding.sources([e for e in embeddings if not e.postings]))
+        return [
             (
                 e.pk,
-                e.embedding,
+                e.embedding.tolist(),
                 {
-                    "classes": list(
-                        itertools.chain.from_iterable(
-                            e.document.metadata["classes"].values()
-                        )
+                    "classes": e.classes
+                    if e.postings
+                    else sorted(
+                        {
+                            c
+                            for doc in next(sources)
+                            if doc
+                            for classes in doc.metadata["classes"].values()
+                            for c in classes
+                        }
                     ),
                 },
             )
             for e in embeddings
         ]
-        if vectors:
-            self.index.upsert(vectors)
+
+    def flush(self):
+        """Writes out any buffered embeddings, and waits for them to be persisted."""
+
+        self.writer.flush()
+        self.index.flush()
+
+    def delete(self, ids: list[str]):
+        """Removes a set of vectors from the vector store."""
+
+        self.index.delete(ids)
+
+    def persist(self, doc: Document) -> list[Embedding]:
+        """Collects the set of embeddings for a Document,
+        and queues them to be persisted to the vector store (call `flush` to wait for them).
+        """
+
+        embeddings = list(self.embed(doc, gen_queries=True))
+        self.upsert(embeddings).add_done_callback(partial(self._persisted, doc))
         return embeddings
+
+    @staticmethod
+    def _persisted(doc: Document, future: Future[None]):
+        if e := future.exception():
+            logging.error(f"Error persisting {doc.metadata.get('file')}: {e}")
@@ -0,0 +1,124 @@
+import os
+import re
+import zlib
+from abc import ABC
+from functools import cached_property
+from typing import Iterable
+
+import numpy as np
+from langchain.embeddings import OpenAIEmbeddings
+from langchain.embeddings.base import Embeddings
+
+from summ.shared import limiter
+
+
+class EmbeddingProvider(Embeddings, ABC):
+    """The model behind an [`Embedder`][summ.embed.Embedder] and a [`Querier`][summ.query.Querier].
+
+    An index only holds vectors from a single provider, so its dimensions follow the provider's.
+    """
+
+    name: str
+    dims: int
+
+    @property
+    def scope(self) -> str:
+        """Distinguishes the cached embeddings of this provider from those of others."""
+
+        return f"{self.name}{self.dims}"
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class OpenAIProvider(EmbeddingProvider):
+    """Embeds texts with the OpenAI API, within the shared rate limit."""
+
+    name = "openai"
+    dims = 1536
+
+    @property
+    def scope(self) -> str:
+        # Embeddings cached before providers were pluggable are all from OpenAI.
+        return ""
+
+    @cached_property
+    def embeddings(self) -> OpenAIEmbeddings:
+        return OpenAIEmbeddings(max_retries=1)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        tokens = sum(map(limiter.embeddings.count_tokens, texts))
+        with limiter.embeddings.limit(tokens):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        with limiter.embeddings.limit(limiter.embeddings.count_tokens(text)):
+            return self.embeddings.embed_query(text)
+
+
+class HashingProvider(EmbeddingProvider):
+    """Embeds texts locally, by hashing their words, word pairs and character n-grams
+    into a fixed number of buckets.
+
+    Needs no network or model, so it suits large backfills, benchmarks and offline runs.
+    Texts only match on shared wording, not on meaning.
+    """
+
+    name = "hashing"
+
+    WORDS = re.compile(r"\w+")
+
+    def __init__(self, dims: int = 1024, ngrams: tuple[int, int] = (3, 5)):
+        """Creates a new HashingProvider.
+
+        Args:
+            dims: The number of buckets (and so the dimensions of each vector).
+            ngrams: The shortest and longest character n-grams to hash.
+        """
+
+        self.dims = dims
+        self.ngrams = ngrams
+
+    def _features(self, text: str) -> Iterable[str]:
+        words = self.WORDS.findall(text.casefold())
+        yield from words
+        yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+        lo, hi = self.ngrams
+        for word in words:
+            padded = f" {word} "
+            for n in range(lo, hi + 1):
+                yield from (padded[i : i + n] for i in range(len(padded) - n + 1))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        rows: list[int] = []
+        features: list[int] = []
+        for row, text in enumerate(texts):
+            hashes = [zlib.crc32(f.encode()) for f in self._features(text)]
+            rows.extend([row] * len(hashes))
+            features.extend(hashes)
+
+        matrix = np.zeros((len(texts), self.dims), dtype=np.float32)
+        hashes = np.array(features, dtype=np.uint32)
+        # The top bit picks a sign, so that collisions tend to cancel out.
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        np.add.at(matrix, (np.array(rows, dtype=np.intp), hashes % self.dims), signs)
+        # Dampen repeated features, then normalize for cosine similarity.
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.maximum(norms, 1e-12)).tolist()
+
+
+def from_env() -> EmbeddingProvider:
+    """Builds the provider named by `SUMM_EMBEDDINGS` (`openai` or `hashing`).
+
+    The dimensions of the `hashing` provider default to 1024, and can be set with
+    `SUMM_EMBEDDINGS_DIMS`.
+    """
+
+    match name := os.environ.get("SUMM_EMBEDDINGS", OpenAIProvider.name):
+        case OpenAIProvider.name:
+            return OpenAIProvider()
+        case HashingProvider.name:
+            return HashingProvider(int(os.environ.get("SUMM_EMBEDDINGS_DIMS", 1024)))
+        case _:
+            raise ValueError(f"Unknown embeddings provider: {name}")
@@ -0,0 +1,480 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from functools import cached_property
+from pathlib import Path
+from threading import RLock
+from typing import Any, Literal, Optional, TypedDict
+
+import numpy as np
+import pinecone
+
+from summ.embed.writer import Vector
+
+
+class Match(TypedDict):
+    id: str
+    score: float
+
+
+class VectorStore(ABC):
+    """The vector index behind an [`Embedder`][summ.embed.Embedder] and a [`Querier`][summ.query.Querier].
+
+    Vectors are compared by cosine similarity. Each one carries the `classes` of the
+    document it came from, which queries can filter on.
+    """
+
+    name: str
+
+    def __init__(self, index: str, dims: int):
+        self.index_name = index
+        self.dims = dims
+        self._checked = False
+
+    @abstractmethod
+    def exists(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def create(self):
+        raise NotImplementedError
+
+    def existing_dims(self) -> Optional[int]:
+        """The dimensions the index was created with, or `None` if it does not exist yet."""
+
+        return self.dims if self.exists() else None
+
+    def check_dims(self):
+        """Raises if the index exists with other dimensions than the embeddings have.
+
+        Only the first call looks the index up, so that opening a store is free.
+        """
+
+        if self._checked:
+            return
+        if (dims := self.existing_dims()) not in (None, self.dims):
+            raise ValueError(
+                f"Index {self.index_name} has {dims} dimensions, but the embeddings have {self.dims}"
+            )
+        self._checked = True
+
+    @abstractmethod
+    def upsert(self, vectors: list[Vector]):
+        """Adds a set of vectors, replacing any with the same ids."""
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def query(
+        self, vector: list[float], top_k: int, classes: list[str] = []
+    ) -> list[Match]:
+        """Finds the `top_k` most similar vectors, best first.
+
+        Args:
+            vector: The vector to compare to.
+            top_k: The number of matches to return.
+            classes: If given, only match vectors tagged with any of these classes.
+        """
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, ids: list[str]):
+        raise NotImplementedError
+
+    def flush(self):
+        """Makes sure every upsert is persisted."""
+
+
+class PineconeStore(VectorStore):
+    """Stores vectors in a hosted Pinecone index."""
+
+    name = "pinecone"
+
+    @cached_property
+    def index(self) -> pinecone.Index:
+        return pinecone.Index(self.index_name)
+
+    def exists(self) -> bool:
+        return self.existing_dims() is not None
+
+    def existing_dims(self) -> Optional[int]:
+        try:
+            return pinecone.describe_index(self.index_name).dimension
+        except pinecone.exceptions.NotFoundException:
+            return None
+
+    def create(self):
+        self.check_dims()
+        pinecone.create_index(
+            self.index_name,
+            dimension=self.dims,
+            metadata_config={"indexed": ["classes"]},
+        )
+
+    def upsert(self, vectors: list[Vector]):
+        self.check_dims()
+        self.index.upsert(vectors)
+
+    def query(
+        self, vector: list[float], top_k: int, classes: list[str] = []
+    ) -> list[Match]:
+        self.check_dims()
+        filter = {"$or": [{"classes": c} for c in classes]} if classes else None
+        results = self.index.query(vector, top_k=top_k, filter=filter)  # type: ignore
+        return [{"id": r["id"], "score": r["score"]} for r in results["matches"]]
+
+    def delete(self, ids: list[str]):
+        self.index.delete(ids=ids)
+
+
+class LocalStore(VectorStore):
+    """Stores vectors in-process, in memory-mapped matrices on local disk.
+
+    Searches are exact by default. With `approximate`, an HNSW graph (from the optional
+    `hnswlib` package) is searched instead, which is much faster on large indices.
+
+    With `quantize`, each vector is held as int8 codes (a quarter of the size), and
+    searched approximately. The best `RERANK` times as many matches as were asked for
+    are then re-scored against the full-precision vectors kept in the
+    [`Embedding`][summ.embed.Embedding] cache. Exact searches score the codes `BLOCK`
+    rows at a time, so memory stays at the size of the codes. An `approximate` graph
+    holds its own float32 copy of every vector though, so only the files on disk shrink.
+
+    The index is a directory holding:
+    - `vectors.npy`: the normalized vectors, one per row. Quantized indices hold
+      `codes.npy` and `scales.npy` instead.
+    - `rows.jsonl`: a log of the id and classes written to each row.
+    - `hnsw.bin`: the HNSW graph, if `approximate` (saved on `flush`, with the generation
+      of `rows.jsonl` it reflects in `hnsw.json`).
+    """
+
+    name = "local"
+
+    EXACT_BELOW = 10_000
+    """With `approximate`, the number of candidates below which an exact search is used anyway."""
+
+    RERANK = 4
+    """With `quantize`, how many more matches than asked for are re-scored at full precision."""
+
+    BLOCK = 16_384
+    """The number of rows read into memory at once, when scoring or building a graph."""
+
+    def __init__(
+        self,
+        index: str,
+        dims: int,
+        root: Path,
+        approximate: bool = False,
+        quantize: Optional[Literal["int8"]] = None,
+    ):
+        """Opens (or prepares to create) a local index.
+
+        Args:
+            index: The name of the index.
+            dims: The number of dimensions of each vector.
+            root: The directory to store indices in.
+            approximate: Whether to search an HNSW graph, rather than every vector.
+            quantize: How to compress the vectors of a new index (`int8`, or `None` to keep
+                them at full precision). Existing indices keep the format they were created with.
+        """
+
+        super().__init__(index, dims)
+        self.path = root / index
+        self.approximate = approximate
+        self.quantize = quantize
+        self.lock = RLock()
+        self.ids: dict[str, int] = {}
+        self.labels: list[Optional[str]] = []
+        self.postings: dict[str, set[int]] = {}
+        self.row_classes: list[list[str]] = []
+        self.arrays: dict[str, np.memmap] = {}
+        self.generation = 0
+        """The number of writes logged to `rows.jsonl` (each upsert or deletion of a row)."""
+        self._graph: Any = None
+        if self.exists():
+            self._load()
+
+    @property
+    def _layout(self) -> dict[str, tuple[type, tuple[int, ...]]]:
+        if self.quantize:
+            return {"codes": (np.int8, (self.dims,)), "scales": (np.float32, ())}
+        return {"vectors": (np.float32, (self.dims,))}
+
+    def exists(self) -> bool:
+        return (self.path / "rows.jsonl").exists()
+
+    def existing_dims(self) -> Optional[int]:
+        if not self.arrays:
+            return None
+        return self.arrays["codes" if self.quantize else "vectors"].shape[1]
+
+    def create(self):
+        self.check_dims()
+        with self.lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._resize(1024)
+            (self.path / "rows.jsonl").touch()
+
+    def _load(self):
+        self.quantize = "int8" if (self.path / "codes.npy").exists() else None
+        for name in self._layout:
+            self.arrays[name] = np.load(self.path / f"{name}.npy", mmap_mode="r+")
+        with open(self.path / "rows.jsonl") as f:
+            for line in f:
+                row, id, classes = json.loads(line)
+                self._assign(row, id, classes)
+                self.generation += 1
+
+    @property
+    def capacity(self) -> int:
+        if not self.arrays:
+            raise ValueError(f"Index {self.index_name} does not exist")
+        return len(next(iter(self.arrays.values())))
+
+    def _resize(self, capacity: int):
+        for name, (dtype, shape) in self._layout.items():
+            tmp, path = self.path / f"{name}.tmp.npy", self.path / f"{name}.npy"
+            array = np.lib.format.open_memmap(
+                tmp, mode="w+", dtype=dtype, shape=(capacity, *shape)
+            )
+            if (old := self.arrays.get(name)) is not None:
+                array[: len(old)] = old
+            array.flush()
+            os.replace(tmp, path)
+            self.arrays[name] = np.load(path, mmap_mode="r+")
+
+    def _assign(self, row: int, id: Optional[str], classes: list[str]):
+        while len(self.labels) <= row:
+            self.labels.append(None)
+            self.row_classes.append([])
+        if (old := self.labels[row]) is not None and self.ids.get(old) == row:
+            del self.ids[old]
+        for c in self.row_classes[row]:
+            self.postings[c].discard(row)
+
+        self.labels[row], self.row_classes[row] = id, classes
+        if id is not None:
+            self.ids[id] = row
+            for c in classes:
+                self.postings.setdefault(c, set()).add(row)
+
+    def _write(self, rows: list[int], matrix: np.ndarray):
+        if self.quantize:
+            scales = np.abs(matrix).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self.arrays["codes"][rows] = np.round(matrix / scales[:, None])
+            self.arrays["scales"][rows] = scales
+        else:
+            self.arrays["vectors"][rows] = matrix
+
+    def _read(self, rows: Any) -> np.ndarray:
+        if self.quantize:
+            codes = self.arrays["codes"][rows].astype(np.float32)
+            return codes * self.arrays["scales"][rows][..., None]
+        return self.arrays["vectors"][rows]
+
+    def _scores(self, rows: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """Scores rows against a query, `BLOCK` rows at a time."""
+
+        scores = np.empty(len(rows), dtype=np.float32)
+        for i in range(0, len(rows), self.BLOCK):
+            block = rows[i : i + self.BLOCK]
+            if self.quantize:
+                # Scaling the products avoids dequantizing the codes.
+                codes = self.arrays["codes"][block].astype(np.float32)
+                scores[i : i + len(block)] = codes @ q * self.arrays["scales"][block]
+            else:
+                scores[i : i + len(block)] = self.arrays["vectors"][block] @ q
+        return scores
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            import hnswlib
+
+            graph = hnswlib.Index(space="ip", dim=self.dims)
+            saved = self.path / "hnsw.json"
+            # Rows written (or deleted) since the graph was last saved would be stale in it.
+            if saved.exists() and json.loads(saved.read_text()) == {
+                "generation": self.generation
+            }:
+                graph.load_index(
+                    str(self.path / "hnsw.bin"), max_elements=self.capacity
+                )
+            else:
+                graph.init_index(max_elements=self.capacity, ef_construction=200, M=16)
+                rows = np.fromiter(self.ids.values(), dtype=np.int64)
+                for i in range(0, len(rows), self.BLOCK):
+                    block = rows[i : i + self.BLOCK]
+                    graph.add_items(self._read(block), block)
+            graph.set_ef(64)
+            self._graph = graph
+        return self._graph
+
+    def upsert(self, vectors: list[Vector]):
+        self.check_dims()
+        vectors = list({id: (id, v, m) for id, v, m in vectors}.values())
+        with self.lock:
+            rows = [self.ids.get(id, -1) for id, _, _ in vectors]
+            for i, row in enumerate(rows):
+                if row < 0:
+                    rows[i] = len(self.labels)
+                    self.labels.append(None)
+                    self.row_classes.append([])
+            if rows and (needed := max(rows) + 1) > self.capacity:
+                self._resize(max(needed, 2 * self.capacity))
+                if self._graph is not None:
+                    self._graph.resize_index(self.capacity)
+
+            matrix = np.array([v for _, v, _ in vectors], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._write(rows, matrix / np.where(norms == 0, 1, norms))
+
+            with open(self.path / "rows.jsonl", "a") as f:
+                for row, (id, _, metadata) in zip(rows, vectors):
+                    classes = list(metadata.get("classes", []))
+                    self._assign(row, id, classes)
+                    f.write(json.dumps([row, id, classes]) + "\n")
+                    self.generation += 1
+
+            if self._graph is not None:
+                self._graph.add_items(self._read(rows), rows)
+
+    def _candidates(self, classes: list[str]) -> Optional[np.ndarray]:
+        if not classes:
+            return None
+        rows = set().union(*(self.postings.get(c, set()) for c in classes))
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def _search(
+        self, q: np.ndarray, k: int, candidates: np.ndarray, filtered: bool
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if self.approximate and len(candidates) >= self.EXACT_BELOW:
+            # Deleted rows are marked in the graph, so only classes need filtering.
+            allowed = set(candidates.tolist()) if filtered else None
+            try:
+                rows, distances = self.graph.knn_query(
+                    q, k=k, filter=(lambda row: row in allowed) if allowed else None
+                )
+            except RuntimeError:
+                # The graph could not reach k allowed rows.
+                pass
+            else:
+                return rows[0], 1 - distances[0]
+
+        scores = self._scores(candidates, q)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    @staticmethod
+    def _full_precision(ids: list[str]) -> list[Optional[np.ndarray]]:
+        # Imported here, since the cache's embeddings are written through this store.
+        from summ.embed.embedder import Embedding
+
+        return [e.embedding if e else None for e in Embedding.get_many(ids)]
+
+    def _rerank(self, q: np.ndarray, matches: list[Match], k: int) -> list[Match]:
+        for match, vector in zip(
+            matches, self._full_precision([m["id"] for m in matches])
+        ):
+            if vector is not None:
+                vector = vector.astype(np.float32)
+                match["score"] = float(vector @ q / (np.linalg.norm(vector) or 1))
+        return sorted(matches, key=lambda m: m["score"], reverse=True)[:k]
+
+    def query(
+        self, vector: list[float], top_k: int, classes: list[str] = []
+    ) -> list[Match]:
+        self.check_dims()
+        q = np.asarray(vector, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1
+        with self.lock:
+            candidates = self._candidates(classes)
+            if candidates is None:
+                candidates = np.fromiter(self.ids.values(), dtype=np.int64)
+            if not len(candidates):
+                return []
+            k = top_k * self.RERANK if self.quantize else top_k
+            rows, scores = self._search(
+                q, min(k, len(candidates)), candidates, bool(classes)
+            )
+            # Skip rows deleted since they were searched (e.g. by a stale graph).
+            matches: list[Match] = [
+                {"id": id, "score": float(score)}
+                for row, score in zip(rows, scores)
+                if (id := self.labels[row]) is not None
+            ]
+
+        return self._rerank(q, matches, top_k) if self.quantize else matches
+
+    def delete(self, ids: list[str]):
+        with self.lock, open(self.path / "rows.jsonl", "a") as f:
+            for id in ids:
+                if (row := self.ids.get(id)) is None:
+                    continue
+                self._assign(row, None, [])
+                self._write([row], np.zeros((1, self.dims), dtype=np.float32))
+                f.write(json.dumps([row, None, []]) + "\n")
+                self.generation += 1
+                if self._graph is not None:
+                    self._graph.mark_deleted(row)
+
+    def flush(self):
+        with self.lock:
+            for array in self.arrays.values():
+                array.flush()
+            if self._graph is not None:
+                self._graph.save_index(str(self.path / "hnsw.bin"))
+                (self.path / "hnsw.json").write_text(
+                    json.dumps({"generation": self.generation})
+                )
+
+
+_stores: dict[tuple[str, str], VectorStore] = {}
+_lock = RLock()
+
+
+def from_env(index: str, dims: int) -> VectorStore:
+    """Builds the store named by `SUMM_INDEX_BACKEND` (`pinecone` or `local`).
+
+    Local indices are stored in `~/.cache/summ/index` by default, which can be set with
+    `SUMM_INDEX_PATH`. Set `SUMM_INDEX_APPROXIMATE=1` to search them with HNSW, and
+    `SUMM_INDEX_QUANTIZE=int8` to create them with quantized vectors.
+    """
+
+    match name := os.environ.get("SUMM_INDEX_BACKEND", PineconeStore.name):
+        case PineconeStore.name:
+            return PineconeStore(index, dims)
+        case LocalStore.name:
+            default = Path.home() / ".cache" / "summ" / "index"
+            return LocalStore(
+                index,
+                dims,
+                root=Path(os.environ.get("SUMM_INDEX_PATH", default)),
+                approximate=os.environ.get("SUMM_INDEX_APPROXIMATE", "") == "1",
+                quantize=os.environ.get("SUMM_INDEX_QUANTIZE") or None,  # type: ignore
+            )
+        case _:
+            raise ValueError(f"Unknown index backend: {name}")
+
+
+def get_store(index: str, dims: int) -> VectorStore:
+    """The store for an index, shared by every [`Embedder`][summ.embed.Embedder] and
+    [`Querier`][summ.query.Querier] in the process.
+
+    The dimensions of an existing index are checked on first use (see
+    [`check_dims`][summ.embed.store.VectorStore.check_dims]), so opening one makes no requests.
+    """
+
+    with _lock:
+        backend = os.environ.get("SUMM_INDEX_BACKEND", PineconeStore.name)
+        if (backend, index) not in _stores:
+            _stores[(backend, index)] = from_env(index, dims)
+        store = _stores[(backend, index)]
+    if store.dims != dims:
+        raise ValueError(
+            f"Index {index} is open with {store.dims} dimensions, but the embeddings have {dims}"
+        )
+    return store
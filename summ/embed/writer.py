@@ -0,0 +1,98 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from itertools import chain
+from threading import RLock, Thread
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from summ.embed.store import VectorStore
+
+Vector = tuple[str, list[float], dict[str, Any]]
+
+
+class VectorWriter:
+    """Buffers upserts across documents, and writes them to the index in large batches.
+
+    The buffer is flushed once it holds `batch_size` vectors, or every `interval` seconds,
+    with up to `max_inflight` flushes running at once. Call `flush` once all writes are
+    done to make sure nothing is left in the buffer.
+    """
+
+    def __init__(
+        self,
+        index: "VectorStore",
+        batch_size: int = 100,
+        interval: float = 1.0,
+        max_inflight: int = 4,
+    ):
+        self.index = index
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pool = ThreadPoolExecutor(max_inflight, thread_name_prefix="summ-writer")
+        self.lock = RLock()
+        self.buffer: list[tuple[list[Vector], Future[None]]] = []
+        self.buffered = 0
+        self.in_flight: set[Future[None]] = set()
+        self._thread: Optional[Thread] = None
+
+    def write(self, vectors: list[Vector]) -> Future[None]:
+        """Queues a set of vectors to be upserted.
+
+        Returns:
+            A future which resolves once the vectors have been written.
+        """
+
+        future: Future[None] = Future()
+        if not vectors:
+            future.set_result(None)
+            return future
+
+        with self.lock:
+            self.buffer.append((vectors, future))
+            self.buffered += len(vectors)
+            if self.buffered >= self.batch_size:
+                self._submit()
+            if not self._thread:
+                self._thread = Thread(
+                    target=self._run, name="summ-writer-timer", daemon=True
+                )
+                self._thread.start()
+        return future
+
+    def flush(self):
+        """Writes out everything buffered, and waits for all in-flight writes."""
+
+        with self.lock:
+            self._submit()
+            in_flight = set(self.in_flight)
+        wait(in_flight)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                self._submit()
+
+    def _submit(self):
+        if not self.buffer:
+            return
+        batch, self.buffer, self.buffered = self.buffer, [], 0
+        future = self.pool.submit(self._upsert, batch)
+        self.in_flight.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future: Future[None]):
+        with self.lock:
+            self.in_flight.discard(future)
+
+    def _upsert(self, batch: list[tuple[list[Vector], Future[None]]]):
+        vectors = list(chain.from_iterable(v for v, _ in batch))
+        try:
+            for i in range(0, len(vectors), self.batch_size):
+                self.index.upsert(vectors[i : i + self.batch_size])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for _, future in batch:
+                future.set_result(None)
@@ -0,0 +1 @@
+from .estimator import Estimate, Estimator, StageEstimate
@@ -0,0 +1,304 @@
+import math
+from functools import cached_property
+from typing import TYPE_CHECKING, ClassVar, Optional
+
+from langchain.docstore.document import Document
+from pydantic import BaseModel, Field
+
+from summ.classify.classifier import Classifier
+from summ.embed.embedder import Embedding
+from summ.shared import limiter
+from summ.shared.limiter import RateLimiter
+
+if TYPE_CHECKING:
+    from summ.pipeline import Pipeline
+
+
+class StageEstimate(BaseModel):
+    """The expected work for a single stage of the pipeline."""
+
+    calls: int = 0
+    """The number of requests which would miss the cache."""
+
+    cached: int = 0
+    """The number of requests which would be served from the cache."""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class Estimate(BaseModel):
+    """The expected cost of a run of the pipeline."""
+
+    files: int = 0
+    skipped: int = 0
+    chunks: int = 0
+    stages: dict[str, StageEstimate] = Field(default_factory=dict)
+    """The completion stages (classify, factify, summarize, query)."""
+
+    embeddings: StageEstimate = Field(default_factory=StageEstimate)
+    """The embedding requests, batched as they would be sent."""
+
+    seconds: float = 0.0
+    """The expected wall time, given the concurrency and rate limits."""
+
+    @property
+    def llm_calls(self) -> int:
+        return sum(s.calls for s in self.stages.values())
+
+    @property
+    def llm_tokens(self) -> int:
+        return sum(s.tokens for s in self.stages.values())
+
+    def report(self) -> str:
+        """A human-readable summary of the estimate."""
+
+        rows = [
+            (name, s.calls, s.cached, s.prompt_tokens, s.completion_tokens)
+            for name, s in [*self.stages.items(), ("embed", self.embeddings)]
+        ]
+        lines = [
+            f"Files: {self.files} ({self.skipped} unchanged), chunks: {self.chunks}",
+            "",
+            f"{'stage':<10} {'calls':>8} {'cached':>8} {'prompt':>12} {'completion':>12}",
+            *(f"{r[0]:<10} {r[1]:>8} {r[2]:>8} {r[3]:>12} {r[4]:>12}" for r in rows),
+            "",
+            f"LLM calls: {self.llm_calls}, tokens: {self.llm_tokens}",
+            f"Embedding calls: {self.embeddings.calls}, tokens: {self.embeddings.tokens}",
+            f"Wall time: ~{math.ceil(self.seconds / 60)} min",
+        ]
+        return "\n".join(lines)
+
+
+class Estimator:
+    """Estimates the cost of populating, without calling any models.
+
+    Files are imported and split exactly as they would be by the pipeline, and
+    every cache key is checked to find the requests which would actually be sent.
+    Prompt sizes are counted from the real templates. Anything which depends on
+    the output of a request that would miss (such as the facts of an uncached chunk)
+    is extrapolated from the averages below.
+    """
+
+    COMPLETION_TOKENS: ClassVar[dict[str, int]] = {
+        "classify": 16,
+        "factify": 256,
+        "summarize": 128,
+        "query": 32,
+    }
+    """The expected number of completion tokens per request (or per generated query), by stage."""
+
+    FACTS_PER_CHUNK: ClassVar[int] = 5
+    """The expected number of facts per chunk, when none are cached."""
+
+    TOKENS_PER_FACT: ClassVar[int] = 24
+    """The expected length of a fact, when none are cached."""
+
+    LATENCY: ClassVar[dict[str, float]] = {"completion": 6.0, "embedding": 1.0}
+    """The expected latency of a single request, in seconds."""
+
+    def __init__(self, pipe: "Pipeline", concurrency: Optional[int] = None):
+        """Creates a new Estimator.
+
+        Args:
+            pipe: The pipeline to estimate a run of.
+            concurrency: The number of completion requests in flight.
+                Defaults to the concurrency of the shared rate limiter.
+        """
+
+        self.pipe = pipe
+        self.concurrency = concurrency or limiter.completions.max_concurrency
+
+    @cached_property
+    def summarize_chain(self):
+        return self.pipe.summarizer.summarize_doc_chain()
+
+    def _complete(self, stage: StageEstimate, name: str, prompt: str, n: int = 1):
+        stage.calls += 1
+        stage.prompt_tokens += limiter.completions.count_tokens(prompt)
+        stage.completion_tokens += self.COMPLETION_TOKENS[name] * n
+
+    def _classify(self, stage: StageEstimate, docs: list[Document]):
+        for klass in Classifier.classifiers.values():
+            classifier = klass()
+            chain = classifier.run_chain()
+            if classifier.peek("run", chain, docs, classifier.classify) is not None:
+                stage.cached += 1
+            else:
+                prompt = chain.prompt.format(**classifier.classify(docs))
+                self._complete(stage, "classify", prompt)
+
+    def _factify(self, stage: StageEstimate, docs: list[Document]) -> list[int]:
+        """Walks a file's chunks in order, following the context through cached results.
+
+        Returns:
+            The number of facts in each chunk, or -1 where it is unknown.
+        """
+
+        factifier, hit, counts = self.pipe.factifier.fork(), True, []
+        chain = factifier.factify_chain()
+        for doc in docs:
+            result = (
+                factifier.peek("factify", chain, doc, factifier.inputs) if hit else None
+            )
+            if result is not None:
+                stage.cached += 1
+                facts, factifier.context = factifier.parse("- " + result)
+                doc.metadata["facts"] = facts
+                counts.append(len(facts))
+            else:
+                # Every later chunk depends on this one's context, so they miss too.
+                hit = False
+                prompt = chain.prompt.format(**factifier.inputs(doc))
+                self._complete(stage, "factify", prompt)
+                counts.append(-1)
+        return counts
+
+    def _summarize(self, stage: StageEstimate, doc: Document):
+        chain = self.summarize_chain
+        if (
+            summary := self.pipe.summarizer.peek(
+                "summarize_doc", chain, [doc], lambda x: x
+            )
+        ) is not None:
+            stage.cached += 1
+            doc.metadata["summary"] = summary.strip()
+        else:
+            prompt = chain.llm_chain.prompt.format(text=doc.page_content)
+            self._complete(stage, "summarize", prompt)
+
+    def _embed(
+        self, estimate: Estimate, doc: Document, n_facts: int
+    ) -> tuple[int, int]:
+        """Counts the uncached facts and generated queries of a chunk, which need embedding.
+
+        Returns:
+            The number of texts to embed, and how many of those were counted exactly.
+        """
+
+        scope = self.pipe.embedder.provider.scope
+
+        def count(texts: list[str]) -> int:
+            counted = 0
+            found = Embedding.get_many(
+                Embedding.query_pk(text, scope) for text in texts
+            )
+            for text, embedding in zip(texts, found):
+                if embedding:
+                    estimate.embeddings.cached += 1
+                else:
+                    counted += 1
+                    estimate.embeddings.prompt_tokens += (
+                        limiter.embeddings.count_tokens(text)
+                    )
+            return counted
+
+        texts = counted = count(doc.metadata.get("facts", []))
+        if "facts" not in doc.metadata:
+            texts += n_facts
+
+        if self.pipe.persist:
+            # The queries of every fact in the chunk are generated by a single request.
+            embedder, query = self.pipe.embedder, estimate.stages["query"]
+            chain = embedder.generate_queries_chain()
+            facts = doc.metadata.get("facts", [""] * n_facts)
+            result = (
+                embedder.peek(
+                    "generate_queries", chain, doc, embedder.generate_queries_inputs
+                )
+                if facts and "facts" in doc.metadata and "summary" in doc.metadata
+                else None
+            )
+            if result is not None:
+                query.cached += 1
+                n = count(
+                    [q for qs in embedder.parse_queries(result, facts) for q in qs]
+                )
+                texts, counted = texts + n, counted + n
+            elif facts:
+                inputs = embedder.generate_queries_inputs(
+                    Document(
+                        page_content=doc.page_content,
+                        metadata={
+                            "facts": facts,
+                            "summary": doc.metadata.get("summary", ""),
+                        },
+                    )
+                )
+                n = len(facts) * embedder.QUERIES
+                self._complete(query, "query", chain.prompt.format(**inputs), n)
+                texts += n
+        return texts, counted
+
+    @staticmethod
+    def _seconds(
+        calls: int, tokens: int, latency: float, concurrency: int, limit: RateLimiter
+    ) -> float:
+        return max(
+            calls * latency / concurrency,
+            calls * 60 / limit.rpm,
+            tokens * 60 / limit.tpm,
+        )
+
+    def estimate(self) -> Estimate:
+        """Imports and splits every pending file, and estimates the cost of populating them."""
+
+        pipe = self.pipe
+        files = sum(1 for _ in pipe.importer.paths)
+        all_docs = [
+            docs
+            for docs in pipe._split_blobs(pipe._pending(pipe.importer.blobs))
+            if docs
+        ]
+        estimate = Estimate(
+            files=files,
+            skipped=files - len(all_docs),
+            chunks=sum(map(len, all_docs)),
+            stages={name: StageEstimate() for name in self.COMPLETION_TOKENS},
+        )
+
+        texts = counted = chain = 0
+        for docs in all_docs:
+            self._classify(estimate.stages["classify"], docs)
+            counts = self._factify(estimate.stages["factify"], docs)
+            chain = max(chain, counts.count(-1))
+            known = [c for c in counts if c >= 0]
+            average = round(sum(known) / len(known)) if known else self.FACTS_PER_CHUNK
+            pipe.summarizer.prefetch_docs(docs)
+            for doc, count in zip(docs, counts):
+                self._summarize(estimate.stages["summarize"], doc)
+                t, c = self._embed(estimate, doc, count if count >= 0 else average)
+                texts, counted = texts + t, counted + c
+
+        # Generated queries (and unknown facts) are assumed to be as long as the known facts.
+        per_text = (
+            estimate.embeddings.prompt_tokens / counted
+            if counted
+            else self.TOKENS_PER_FACT
+        )
+        estimate.embeddings.prompt_tokens += round((texts - counted) * per_text)
+        estimate.embeddings.calls = math.ceil(texts / pipe.embedder.batcher.max_size)
+
+        completions = self._seconds(
+            estimate.llm_calls,
+            estimate.llm_tokens,
+            self.LATENCY["completion"],
+            self.concurrency,
+            limiter.completions,
+        )
+        embeddings = self._seconds(
+            estimate.embeddings.calls,
+            estimate.embeddings.tokens,
+            self.LATENCY["embedding"],
+            pipe.embedder.batcher.max_inflight,
+            limiter.embeddings,
+        )
+        # Stages overlap, but each file's chunks must be factified one after another.
+        estimate.seconds = max(
+            completions, embeddings, chain * self.LATENCY["completion"]
+        )
+        return estimate
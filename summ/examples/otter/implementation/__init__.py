@@ -14,7 +14,7 @@ def summ_and_pipe():
     summ = Summ(index="cronutt-facts")
 
     path = Path(__file__).parent.parent / "interviews"
-    pipe = Pipeline.default(path, summ.index)
+    pipe = Pipeline.default(path, summ.index, summ.provider)
     pipe.splitter = OtterSplitter(
         speakers_to_exclude=[
             "Cindy Buckmaster",
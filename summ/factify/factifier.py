@@ -1,5 +1,6 @@
+import copy
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Self
 
 from langchain import FewShotPromptTemplate, PromptTemplate
 from langchain.chains import LLMChain
@@ -105,6 +106,22 @@ class Factifier(Chain):
         super().__init__(*args, **kwargs)
         self.context = context or self.DEFAULT_CONTEXT
 
+    def fork(self) -> Self:
+        """Returns a copy of this Factifier with a fresh context.
+
+        The context is a rolling summary of a single file, so each file should be factified
+        in order by its own fork.
+        """
+
+        forked = copy.copy(self)
+        forked.context = self.DEFAULT_CONTEXT
+        return forked
+
+    def inputs(self, doc: Document) -> dict[str, str]:
+        """The prompt variables for a given document, in the current context."""
+
+        return {"chunk": doc.page_content, "context": self.context}
+
     def parse(self, results: str) -> tuple[list[str], str]:
         try:
             idx = results.lower().index("context")
@@ -116,15 +133,12 @@ class Factifier(Chain):
         facts = self._parse(facts_raw.splitlines(), prefix=r"-+")
         return facts, context
 
+    def factify_chain(self) -> LLMChain:
+        return LLMChain(llm=self.llm, prompt=self.PROMPT_TEMPLATE)
+
     def factify(self, doc: Document) -> list[str]:
         """Returns a list of facts from the given document."""
 
-        chain = LLMChain(llm=self.llm, prompt=self.PROMPT_TEMPLATE)
-        results = "- " + self.cached(
-            "factify",
-            chain,
-            doc,
-            lambda d: {"chunk": d.page_content, "context": self.context},
-        )
+        results = "- " + self.cached("factify", self.factify_chain(), doc, self.inputs)
         facts, self.context = self.parse(results)
         return facts
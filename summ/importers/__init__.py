@@ -1 +1,3 @@
 from .importer import Importer as Importer
+from .journal import Journal as Journal
+from .manifest import Manifest as Manifest
@@ -20,7 +20,9 @@ class Importer:
 
     @property
     def blobs(self) -> Iterable[TextIO]:
+        """Lazily opens each file. Consumers are responsible for closing them."""
+
         return map(Path.open, self.paths)
 
     def docs(self) -> Iterable[Document]:
-        return [Document(page_content=blob.read()) for blob in self.blobs]
+        return [Document(page_content=path.read_text()) for path in self.paths]
@@ -0,0 +1,127 @@
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from threading import RLock
+from typing import Iterable, Optional, Self, TextIO
+
+import metrohash
+from langchain.docstore.document import Document
+
+
+class Journal:
+    """A local, append-only log of the stages each Document has completed.
+
+    Every completed stage is written (with its result) as a single JSON line,
+    so a run that dies partway can be resumed without redoing any finished work.
+    """
+
+    STAGES = ("factified", "summarized", "embedded", "upserted")
+    """The stages that are recorded, in the order they are completed."""
+
+    def __init__(self, path: Path):
+        """Creates a journal.
+
+        Args:
+            path: The JSONL file to append to.
+        """
+
+        self.path = path
+        self.lock = RLock()
+        self.entries: dict[str, dict[str, dict]] = defaultdict(dict)
+        self._file: Optional[TextIO] = None
+
+    @classmethod
+    def default(cls, dir: Path, index: str) -> Self:
+        """The journal for a given index, stored alongside the imported files."""
+
+        return cls(dir / ".summ" / f"{index}.journal.jsonl")
+
+    @staticmethod
+    def key(doc: Document) -> str:
+        content = metrohash.hash64(doc.page_content, seed=0).hex()
+        return f"{doc.metadata['file']}:{doc.metadata.get('chunk', '')}:{content}"
+
+    def open(self, resume: bool = False):
+        """Starts a new run.
+
+        Args:
+            resume: Whether to replay the previous run's entries, instead of starting afresh.
+        """
+
+        with self.lock:
+            self.close()
+            self.entries.clear()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if resume and self.path.exists():
+                self._load()
+            self._file = self.path.open("a" if resume else "w")
+
+    def read(self):
+        """Loads the entries on disk, without starting a run."""
+
+        with self.lock:
+            self.entries.clear()
+            if self.path.exists():
+                self._load()
+
+    def _load(self):
+        with self.path.open() as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may have been cut off by a crash.
+                    break
+                self.entries[entry.pop("doc")][entry.pop("stage")] = entry
+
+    def close(self):
+        with self.lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def discard(self, files: Iterable[str]):
+        """Drops the entries of a set of files (such as those fully populated), rewriting
+        the journal without them. Removes the journal once it is empty.
+
+        Call this between runs, once the journal is closed.
+        """
+
+        files = set(files)
+        with self.lock:
+            self.entries = defaultdict(
+                dict,
+                {
+                    k: v
+                    for k, v in self.entries.items()
+                    if k.rsplit(":", 2)[0] not in files
+                },
+            )
+            if not self.entries:
+                self.path.unlink(missing_ok=True)
+                return
+
+            tmp = self.path.with_suffix(".tmp")
+            with tmp.open("w") as f:
+                for key, stages in self.entries.items():
+                    for stage, result in stages.items():
+                        f.write(json.dumps({"doc": key, "stage": stage, **result}))
+                        f.write("\n")
+            os.replace(tmp, self.path)
+
+    def get(self, doc: Document, stage: str) -> Optional[dict]:
+        """Returns the recorded result of a stage, if it was completed."""
+
+        return self.entries.get(self.key(doc), {}).get(stage)
+
+    def mark(self, doc: Document, stage: str, **result):
+        """Records that a Document has completed a stage."""
+
+        key = self.key(doc)
+        with self.lock:
+            self.entries[key][stage] = result
+            if self._file:
+                self._file.write(json.dumps({"doc": key, "stage": stage, **result}))
+                self._file.write("\n")
+                self._file.flush()
@@ -0,0 +1,85 @@
+import json
+import os
+from pathlib import Path
+from threading import RLock
+from typing import Optional, Self
+
+import metrohash
+from pydantic import BaseModel, Field
+
+
+class ManifestEntry(BaseModel):
+    hash: str
+    ids: list[str] = Field(default_factory=list)
+
+
+class Manifest:
+    """A persisted record of every fully-populated file.
+
+    Stores the content hash of each imported file, along with the ids of the vectors
+    that were produced for it. Files whose content has not changed can be skipped entirely.
+    """
+
+    def __init__(self, path: Path):
+        """Loads (or creates) a manifest.
+
+        Args:
+            path: The JSON file to persist the manifest to.
+        """
+
+        self.path = path
+        self.lock = RLock()
+        self.entries: dict[str, ManifestEntry] = {}
+        if path.exists():
+            self.entries = {
+                k: ManifestEntry(**v) for k, v in json.loads(path.read_text()).items()
+            }
+
+    @classmethod
+    def default(cls, dir: Path, index: str) -> Self:
+        """The manifest for a given index, stored alongside the imported files."""
+
+        return cls(dir / ".summ" / f"{index}.manifest.json")
+
+    @staticmethod
+    def hash(text: str) -> str:
+        return metrohash.hash64(text, seed=0).hex()
+
+    def get(self, name: str) -> Optional[ManifestEntry]:
+        return self.entries.get(name)
+
+    def is_fresh(self, name: str, hash: str) -> bool:
+        """Checks if a file was fully populated with exactly this content."""
+
+        return (entry := self.get(name)) is not None and entry.hash == hash
+
+    def record(self, name: str, hash: str, ids: list[str]) -> list[str]:
+        """Records a file as fully populated.
+
+        Returns:
+            The ids previously produced for this file which are no longer referenced by any file.
+        """
+
+        with self.lock:
+            old = self.entries.get(name)
+            self.entries[name] = ManifestEntry(hash=hash, ids=ids)
+            self.save()
+
+            if not old:
+                return []
+            live = {id for entry in self.entries.values() for id in entry.ids}
+            return [id for id in old.ids if id not in live]
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.save()
+
+    def save(self):
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(
+                json.dumps({k: v.dict() for k, v in self.entries.items()}, indent=2)
+            )
+            os.replace(tmp, self.path)
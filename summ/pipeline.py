@@ -1,21 +1,48 @@
+import asyncio
 import logging
 import os
 import traceback
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
 from functools import partial
-from itertools import chain
+from itertools import chain, islice
 from pathlib import Path
-from typing import Generator, Generic, Iterable, Self, TextIO, Type
+from threading import Lock
+from typing import (
+    ClassVar,
+    Generator,
+    Generic,
+    Iterable,
+    Iterator,
+    Optional,
+    Self,
+    TextIO,
+    Type,
+    cast,
+)
 
+import cloudpickle
 import metrohash
 from langchain.docstore.document import Document
-from openai.error import RateLimitError
-from retry import retry
 
+from summ.cache.lru import lru
 from summ.classify.classifier import C, Classifier
-from summ.embed.embedder import Embedder
+from summ.embed.embedder import Embedder, Embedding
+from summ.embed.provider import EmbeddingProvider
+from summ.estimate.estimator import Estimate, Estimator
 from summ.factify.factifier import Factifier
 from summ.importers.importer import Importer
-from summ.shared.chain import Chain
+from summ.importers.journal import Journal
+from summ.importers.manifest import Manifest
+from summ.shared.chain import Backend, Chain
+from summ.shared.limiter import retry_transient
+from summ.shared.stages import Stages
 from summ.splitter.gpt_splitter import GPTSplitter
 from summ.splitter.splitter import Splitter
 from summ.summarize.summarizer import Summarizer
@@ -35,11 +62,31 @@ class Pipeline(Chain, Generic[C]):
     importer: Importer
     embedder: Embedder
 
+    LIMITS: ClassVar[dict[str, int]] = {
+        "split": 4,
+        "classify": 8,
+        "factify": 64,
+        "summarize": 64,
+        "embed": 64,
+        "upsert": 8,
+    }
+    """The default number of in-flight calls per stage when running with [`arun`][summ.pipeline.Pipeline.arun]."""
+
+    SPLIT_BACKEND: ClassVar[Backend] = "processes"
+    """The executor backend used to split every file at once when populating. Splitting is CPU-bound, so this defaults to a process pool.
+
+    Other callers (such as [`corpus`][summ.pipeline.Pipeline.corpus]) split on threads, to avoid starting a pool per query.
+    """
+
     @classmethod
-    def default(cls, path: Path, index: str) -> Self:
+    def default(
+        cls, path: Path, index: str, provider: Optional[EmbeddingProvider] = None
+    ) -> Self:
         return cls(
             importer=Importer(path),
-            embedder=Embedder(index),
+            embedder=Embedder(index, provider=provider),
+            manifest=Manifest.default(path, index),
+            journal=Journal.default(path, index),
             persist=True,
             verbose=True,
         )
@@ -48,6 +95,8 @@ class Pipeline(Chain, Generic[C]):
         self,
         importer: Importer,
         embedder: Embedder,
+        manifest: Optional[Manifest] = None,
+        journal: Optional[Journal] = None,
         persist: bool = False,
         verbose: bool = False,
     ):
@@ -58,17 +107,68 @@ class Pipeline(Chain, Generic[C]):
         self.summarizer = Summarizer()
         self.embedder = embedder
         self.importer = importer
+        self.manifest = manifest
+        self.journal = journal
         self.persist = persist
+        self._hashes: dict[str, str] = {}
+        self._recorded: set[str] = set()
+        self._upserts: dict[int, Future[None]] = {}
+
+    def _restore(self, doc: Document, stage: str) -> Optional[dict]:
+        return self.journal.get(doc, stage) if self.journal and self.persist else None
+
+    def _mark(self, doc: Document, stage: str, **result):
+        if self.journal and self.persist:
+            self.journal.mark(doc, stage, **result)
+
+    @retry_transient()
+    def _factify(self, factifier: Factifier, doc: Document):
+        if "facts" in doc.metadata:
+            return
+        elif restored := self._restore(doc, "factified"):
+            doc.metadata["facts"] = restored["facts"]
+            factifier.context = restored["context"]
+        else:
+            doc.metadata["facts"] = factifier.factify(doc)
+            self._mark(
+                doc, "factified", facts=doc.metadata["facts"], context=factifier.context
+            )
+
+    def _summarize(self, doc: Document):
+        if restored := self._restore(doc, "summarized"):
+            doc.metadata["summary"] = restored["summary"]
+        elif "summary" not in doc.metadata:
+            doc.metadata["summary"] = self.summarizer.summarize_doc(doc)
+            self._mark(doc, "summarized", summary=doc.metadata["summary"])
+
+    def _embed(self, doc: Document) -> list[Embedding]:
+        if restored := self._restore(doc, "embedded"):
+            return [e for e in Embedding.get_many(restored["ids"]) if e]
+        embeddings = list(self.embedder.embed(doc, gen_queries=self.persist))
+        self._mark(doc, "embedded", ids=[e.pk for e in embeddings])
+        return embeddings
+
+    def _upsert(self, doc: Document, embeddings: list[Embedding]):
+        self._upserts[id(doc)] = future = self.embedder.upsert(embeddings)
+        future.add_done_callback(partial(self._upserted, doc))
 
-    @retry(
-        exceptions=RateLimitError,
-        tries=5,
-        delay=10,
-        backoff=2,
-        max_delay=120,
-        jitter=(0, 10),
-    )
+    def _upserted(self, doc: Document, future: Future[None]):
+        if e := future.exception():
+            logging.error(f"Error upserting {doc.metadata['file']}: {e}")
+        else:
+            self._mark(doc, "upserted")
+
+    def _needs_embedding(self, doc: Document) -> bool:
+        return (
+            "embeddings" not in doc.metadata and self._restore(doc, "upserted") is None
+        )
+
+    @retry_transient()
     def _process_doc(self, doc: Document, classes: dict[str, list[C]]) -> Document:
+        if "facts" not in doc.metadata:
+            # Its file's chain stopped before this chunk, so it's left for a resumed run.
+            return doc
+
         self.dprint(
             f"Document {self._ppprogress()}",
             metrohash.hash64(doc.page_content).hex()[:5],
@@ -80,42 +180,267 @@ class Pipeline(Chain, Generic[C]):
                     doc.metadata["classes"] = classes
 
                 self.dprint("Factify", color="yellow")
-                if "facts" not in doc.metadata:
-                    doc.metadata["facts"] = self.factifier.factify(doc)
                 self.dprint("", doc.metadata["facts"])
 
                 self.dprint("Summarize", color="yellow")
-                if "summary" not in doc.metadata:
-                    doc.metadata["summary"] = self.summarizer.summarize_doc(doc)
+                self._summarize(doc)
                 self.dprint("", doc.metadata["summary"])
 
-                if "embeddings" not in doc.metadata:
-                    doc.metadata["embeddings"] = (
-                        self.embedder.persist(doc)
-                        if self.persist
-                        else self.embedder.embed(doc)
-                    )
+                if self._needs_embedding(doc):
+                    if self.persist:
+                        doc.metadata["embeddings"] = self._embed(doc)
+                        self._upsert(doc, doc.metadata["embeddings"])
+                    else:
+                        doc.metadata["embeddings"] = self.embedder.embed(doc)
             except Exception as e:
-                logging.error(f"Error processing {doc.metadata['file']}")
-                traceback.print_exception(e)
-                if "PYTEST_CURRENT_TEST" in os.environ:
-                    raise e
+                self._log_error(doc, e)
             finally:
                 return doc
 
+    def _log_error(self, doc: Document, e: Exception):
+        logging.error(f"Error processing {doc.metadata['file']}")
+        traceback.print_exception(e)
+        if "PYTEST_CURRENT_TEST" in os.environ:
+            raise e
+
+    def _factify_next(self, factifier: Factifier, doc: Document) -> bool:
+        """Factifies the next chunk of a file's chain.
+
+        Returns:
+            Whether the chain can continue. Later chunks would be factified with the wrong
+            context once one fails, so they're left for a resumed run instead.
+        """
+
+        try:
+            self._factify(factifier, doc)
+            return True
+        except Exception as e:
+            self._log_error(doc, e)
+            return False
+
+    def _factify_file(self, docs: list[Document]):
+        """Factifies the chunks of a single file in order,
+        threading one rolling context through them."""
+
+        factifier = self.factifier.fork()
+        for doc in docs:
+            if not self._factify_next(factifier, doc):
+                break
+
+    async def _aprocess_doc(
+        self,
+        stages: Stages,
+        doc: Document,
+        classes: "asyncio.Task[dict[str, list[C]]]",
+    ) -> Document:
+        try:
+            if "classes" not in doc.metadata:
+                doc.metadata["classes"] = await classes
+            await stages.run("summarize", self._summarize, doc)
+            if self._needs_embedding(doc):
+                embeddings = await stages.run("embed", self._embed, doc)
+                if self.persist:
+                    await stages.run("upsert", self._upsert, doc, embeddings)
+                doc.metadata["embeddings"] = embeddings
+        except Exception as e:
+            self._log_error(doc, e)
+        return doc
+
+    def _pending(self, blobs: Iterable[TextIO]) -> Generator[TextIO, None, None]:
+        """Skips files which the manifest shows were already fully populated."""
+
+        for blob in blobs:
+            if not (self.manifest and self.persist):
+                yield blob
+                continue
+
+            name = Path(blob.name).stem
+            self._hashes[name] = hash = self.manifest.hash(blob.read())
+            if self.manifest.is_fresh(name, hash):
+                self.dprint("Unchanged", name, color="blue")
+                blob.close()
+            else:
+                blob.seek(0)
+                yield blob
+
+    def _vector_ids(self, doc: Document) -> Optional[list[str]]:
+        if isinstance(embeddings := doc.metadata.get("embeddings"), list):
+            return [e.pk for e in embeddings]
+        elif self._restore(doc, "upserted") is not None:
+            return (self._restore(doc, "embedded") or {}).get("ids", [])
+        else:
+            return None
+
+    def _record(self, docs: list[Document]):
+        """Marks a file as fully populated, and removes any vectors it no longer produces.
+
+        The file is recorded once all of its upserts have been written, without waiting
+        for them here.
+        """
+
+        if not (self.manifest and self.persist and docs):
+            return
+
+        doc_ids = [self._vector_ids(doc) for doc in docs]
+        if any(i is None for i in doc_ids):
+            return
+
+        name = docs[0].metadata["file"]
+        ids = list(dict.fromkeys(id for i in doc_ids for id in i or []))
+        live: dict[str, set[str]] = {}
+        for doc, i in zip(docs, doc_ids):
+            for pk in i or []:
+                live.setdefault(pk, set()).add(cast(str, Embedding.chunk_of(doc)))
+        commit = partial(self._commit, name, self._hashes.pop(name), ids, live)
+        upserts = [f for doc in docs if (f := self._upserts.pop(id(doc), None))]
+        if not upserts:
+            return commit()
+
+        lock, remaining = Lock(), [len(upserts)]
+
+        def done(_: Future[None]):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if not any(f.exception() for f in upserts):
+                commit()
+
+        for future in upserts:
+            future.add_done_callback(done)
+
+    def _commit(self, name: str, hash: str, ids: list[str], live: dict[str, set[str]]):
+        try:
+            manifest = cast(Manifest, self.manifest)
+            old = manifest.get(name)
+            if stale := manifest.record(name, hash, ids):
+                self.embedder.delete(stale)
+            # Shared facts may still be produced by other files, but not by this one's old chunks.
+            kept = [id for id in [*(old.ids if old else []), *ids] if id not in stale]
+            self.embedder.prune(name, live, kept)
+            self._recorded.add(name)
+        except Exception as e:
+            logging.error(f"Error recording {name}: {e}")
+
+    def _read_blob(self, blob: TextIO) -> tuple[str, str]:
+        with blob:
+            return Path(blob.name).stem, blob.read()
+
+    @staticmethod
+    def _number(docs: list[Document]) -> list[Document]:
+        for i, doc in enumerate(docs):
+            doc.metadata["chunk"] = i
+        return docs
+
+    def _split_text(self, name: str, text: str) -> list[Document]:
+        return self._number(self.splitter.split(name, text))
+
     def _split_blob(self, blob: TextIO) -> list[Document]:
-        return self.splitter.split(Path(blob.name).stem, blob.read())
+        return self._split_text(*self._read_blob(blob))
+
+    def _split_backend(self) -> Backend:
+        """The `SPLIT_BACKEND`, or threads if the splitter can't be sent to another process."""
+
+        if self.SPLIT_BACKEND == "processes":
+            try:
+                # Process pools pickle with cloudpickle, which handles closures (like tiktoken length functions).
+                cloudpickle.dumps(self.splitter)
+            except Exception as e:
+                logging.info(
+                    f"Splitting on threads, as the splitter can't be pickled: {e}"
+                )
+                return "threads"
+        return self.SPLIT_BACKEND
+
+    def _split_blobs(
+        self, blobs: Iterable[TextIO], backend: Backend = "threads"
+    ) -> list[list[Document]]:
+        """Splits every file at once."""
+
+        texts = [self._read_blob(blob) for blob in blobs]
+        return [
+            self._number(docs)
+            for docs in self._parallel(self.splitter.split, texts, backend=backend)
+        ]
+
+    def _prefetch(self, docs: list[Document]):
+        """Loads the cache state of a whole file's chunks at once."""
+
+        try:
+            self.summarizer.prefetch_docs(docs)
+        except Exception as e:
+            logging.warning(f"Error prefetching from the cache: {e}")
 
     def _process_blob(self, blob: TextIO) -> Iterable[Document]:
         docs = self._split_blob(blob)
+        self._prefetch(docs)
+        classes = self.classifier.classify_all(docs)
+        factifier: Optional[Factifier] = self.factifier.fork()
+        for doc in docs:
+            if factifier and not self._factify_next(factifier, doc):
+                factifier = None
+            yield self._process_doc(doc, classes)
+
+    async def _aprocess_text(
+        self, stages: Stages, name: str, text: str
+    ) -> list[Document]:
+        """Factifies a file's chunks as an ordered chain, handing each chunk
+        off to the remaining stages as soon as its facts are ready."""
+
+        docs = await stages.run("split", self._split_text, name, text)
+        if not docs:
+            return []
+        self.dprint("File", docs[0].metadata["file"][:5], color="green")
+        await asyncio.to_thread(self._prefetch, docs)
+        classes = asyncio.create_task(
+            stages.run("classify", self.classifier.classify_all, docs)
+        )
+
+        factifier = self.factifier.fork()
+        pending = []
+        for doc in docs:
+            if not await stages.run("factify", self._factify_next, factifier, doc):
+                break
+            pending.append(
+                asyncio.create_task(self._aprocess_doc(stages, doc, classes))
+            )
+
+        # Classification errors are logged by each chunk which awaits them.
+        [classified, *_] = await asyncio.gather(
+            classes, *pending, return_exceptions=True
+        )
+        if isinstance(classified, Exception) and not pending:
+            self._log_error(docs[0], classified)
+        await asyncio.to_thread(self._record, docs)
+        return docs
+
+    def _process_file(self, pool: Executor, blob: TextIO) -> list[Document]:
+        docs = self._split_blob(blob)
+        if not docs:
+            return []
+        self.dprint("File", docs[0].metadata["file"][:5], color="green")
+        self._prefetch(docs)
         classes = self.classifier.classify_all(docs)
-        return map(partial(self._process_doc, classes=classes), docs)
+        self._factify_file(docs)
+        processed = list(pool.map(partial(self._process_doc, classes=classes), docs))
+        self._record(processed)
+        return processed
 
     def _rung(self, blobs: Iterable[TextIO]) -> Generator[Document, None, None]:
-        yield from chain.from_iterable(map(self._process_blob, blobs))
+        for blob in blobs:
+            docs = []
+            for doc in self._process_blob(blob):
+                docs.append(doc)
+                yield doc
+            self._record(docs)
 
     def _runpg(self, blobs: Iterable[TextIO]) -> Generator[Document, None, None]:
-        all_docs = self._pmap(self._split_blob, blobs)
+        all_docs = self._split_blobs(blobs, self._split_backend())
+
+        # Files run concurrently, but each file's chunks are factified in order.
+        self.dprint("Factify", f"{len(all_docs)} files", color="cyan")
+        self._pmap(self._factify_file, all_docs)
+
         for i, docs in enumerate(all_docs):
             self.dprint(
                 f"File [{i}/{len(all_docs)}]",
@@ -123,10 +448,13 @@ class Pipeline(Chain, Generic[C]):
                 color="green",
             )
             with self.dprint.indent_children():
+                self._prefetch(docs)
                 self.dprint("Classify", color="cyan")
                 classes = self.classifier.classify_all(docs)
                 self.dprint("", {k: [x.name for x in v] for k, v in classes.items()})
-                yield from self._pmap(self._process_doc, docs, classes)
+                processed = self._pmap(self._process_doc, docs, classes)
+                self._record(processed)
+                yield from processed
 
     def _runp(self, blobs: Iterable[TextIO]) -> list[Document]:
         return list(self._runpg(blobs))
@@ -134,21 +462,138 @@ class Pipeline(Chain, Generic[C]):
     def corpus(self) -> Generator[Document, None, None]:
         """Yields the extracted source corpus"""
         self.splitter = GPTSplitter.wrap(self.splitter)
-        for docs in self._pmap(self._split_blob, self.importer.blobs):
+        for docs in self._split_blobs(self.importer.blobs):
             yield from docs
 
-    def rung(self) -> Generator[Document, None, None]:
+    @contextmanager
+    def _session(self, resume: bool):
+        if self.journal and self.persist:
+            self.journal.open(resume=resume)
+        self._recorded.clear()
+        clean = False
+        try:
+            yield
+            clean = True
+        finally:
+            if self.persist:
+                self.embedder.flush()
+            if self.journal:
+                self.journal.close()
+                # Files now in the manifest won't be resumed, so their entries are dropped.
+                if clean and self.persist:
+                    self.journal.discard(self._recorded)
+            self.dprint("Cache", lru.stats(), color="blue")
+            self.dprint("Coalesced calls", self.flights.shared, color="blue")
+
+    def rung(self, resume: bool = False) -> Generator[Document, None, None]:
         """Yields one Embedding at a time.
 
         Helpful for when you want to test only a small part of your pipeline.
         """
 
-        yield from self._rung(self.importer.blobs)
+        with self._session(resume):
+            yield from self._rung(self._pending(self.importer.blobs))
 
-    def runp(self) -> list[Document]:
+    def runp(self, resume: bool = False) -> list[Document]:
         """Calculates all embeddings in parallel. Very fast!"""
 
-        return self._runp(self.importer.blobs)
+        with self._session(resume):
+            return self._runp(self._pending(self.importer.blobs))
+
+    def stream(
+        self, window: int = 8, workers: Optional[int] = None, resume: bool = False
+    ) -> Generator[Document, None, None]:
+        """Yields fully-processed Documents as their files complete.
+
+        Only `window` files are read and held in memory at once, so memory stays flat
+        regardless of the size of the corpus.
+
+        Args:
+            window: The number of files to keep in flight.
+            workers: The number of threads processing chunks, shared across all files.
+            resume: Whether to continue from the journal of an interrupted run.
+        """
+
+        blobs = self._pending(self.importer.blobs)
+        with self._session(resume), ThreadPoolExecutor(workers) as pool:
+            with ThreadPoolExecutor(window) as files:
+                in_flight = {
+                    files.submit(self._process_file, pool, blob)
+                    for blob in islice(blobs, window)
+                }
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if blob := next(blobs, None):
+                            in_flight.add(files.submit(self._process_file, pool, blob))
+                        yield from future.result()
+
+    async def _afeed(
+        self,
+        stages: Stages,
+        blobs: Iterator[tuple[int, TextIO]],
+        lock: asyncio.Lock,
+        results: dict[int, list[Document]],
+    ):
+        """Processes files one after another, until none are left.
+
+        Each file is read and closed as soon as it's taken, so only one is ever open.
+        """
+
+        while True:
+            # Only one caller may advance the iterator at a time.
+            async with lock:
+                if not (item := await asyncio.to_thread(next, blobs, None)):
+                    return
+                i, blob = item
+                name, text = await asyncio.to_thread(self._read_blob, blob)
+            results[i] = await self._aprocess_text(stages, name, text)
+
+    async def arun(
+        self,
+        limits: Optional[dict[str, int]] = None,
+        resume: bool = False,
+        window: int = 256,
+    ) -> list[Document]:
+        """Calculates all embeddings on an event loop.
+
+        Up to `window` files, and every one of their chunks, are in flight at once.
+        Files are read as they enter the window, so only one is open at a time.
+        Each stage (split, classify, factify, summarize, embed, upsert) is bounded by its own limit.
+
+        Args:
+            limits: Overrides for the per-stage limits in `LIMITS`.
+            resume: Whether to continue from the journal of an interrupted run.
+            window: The number of files to keep in flight.
+        """
+
+        blobs = enumerate(self._pending(self.importer.blobs))
+        results: dict[int, list[Document]] = {}
+        with self._session(resume):
+            async with Stages({**self.LIMITS, **(limits or {})}) as stages:
+                lock = asyncio.Lock()
+                await asyncio.gather(
+                    *(self._afeed(stages, blobs, lock, results) for _ in range(window))
+                )
+        return list(chain.from_iterable(results[i] for i in sorted(results)))
+
+    def estimate(self, concurrency: Optional[int] = None) -> Estimate:
+        """Estimates the calls, tokens and wall time of a run, without calling any models.
+
+        Args:
+            concurrency: The number of completion requests in flight.
+        """
+
+        return Estimator(self, concurrency=concurrency).estimate()
+
+    def run(self, parallel: bool = True, resume: bool = False) -> list[Document]:
+        """Runs the whole pipeline.
+
+        Args:
+            parallel: Whether to process files and chunks in parallel.
+            resume: Whether to continue from the journal of an interrupted run,
+                skipping every stage that was already completed. Documents which were
+                already upserted are returned without their `embeddings`.
+        """
 
-    def run(self, parallel: bool = True) -> list[Document]:
-        return self.runp() if parallel else list(self.rung())
+        return self.runp(resume) if parallel else list(self.rung(resume))
@@ -1,9 +1,8 @@
 import itertools
 import json
 import re
-from typing import Type, TypedDict, cast, overload
+from typing import Optional, Type, TypedDict, cast, overload
 
-import pinecone
 from langchain import (
     BasePromptTemplate,
     FewShotPromptTemplate,
@@ -11,13 +10,13 @@ from langchain import (
     PromptTemplate,
 )
 from langchain.docstore.document import Document
-from langchain.embeddings import OpenAIEmbeddings
-from openai.error import RateLimitError
-from retry import retry
 
 from summ.classify.classes import Classes
 from summ.embed.embedder import Embedding
+from summ.embed.provider import EmbeddingProvider, from_env
+from summ.embed.store import get_store
 from summ.shared.chain import Chain
+from summ.shared.limiter import retry_transient
 from summ.shared.utils import dedent
 from summ.structure.sql_structurer import SQLStructurer
 from summ.structure.structurer import Structurer
@@ -63,12 +62,19 @@ class Querier(Chain):
         ),
     )
 
-    def __init__(self, index: str, debug: bool = False):
+    RENDERED_PROMPT = PromptTemplate(input_variables=["prompt"], template="{prompt}")
+
+    def __init__(
+        self,
+        index: str,
+        debug: bool = False,
+        provider: Optional[EmbeddingProvider] = None,
+    ):
         super().__init__(debug=debug)
         self.index_name = index
-        self.embeddings = OpenAIEmbeddings()
+        self.embeddings = provider or from_env()
         self.summarizer = Summarizer()
-        self.index = pinecone.Index(index)
+        self.index = get_store(index, self.embeddings.dims)
         self.facts = set()
 
     # Questions
@@ -267,14 +273,6 @@ class Querier(Chain):
     ) -> list[str]:
         ...
 
-    @retry(
-        exceptions=RateLimitError,
-        tries=5,
-        delay=10,
-        backoff=2,
-        max_delay=120,
-        jitter=(0, 10),
-    )
     def _query(
         self,
         prompt: BasePromptTemplate,
@@ -283,8 +281,10 @@ class Querier(Chain):
         quiet: bool = False,
         **kwargs,
     ):
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        results = initial + chain.run(**kwargs)
+        # The LLM is deterministic, so the result is cached on the rendered prompt.
+        rendered = Document(page_content=prompt.format(**kwargs))
+        chain = LLMChain(llm=self.llm, prompt=self.RENDERED_PROMPT)
+        results = initial + self.cached("query", chain, rendered)
         if not quiet:
             self.dprint(results)
         if initial and prefix:
@@ -292,30 +292,40 @@ class Querier(Chain):
         else:
             return results
 
+    @retry_transient()
+    def _embed_query(self, query: str) -> list[float]:
+        return self.embeddings.embed_query(query)
+
     def _query_facts(self, query: str, n: int, classes: list[Classes]):
-        embedding = self.embeddings.embed_query(query)
-        filter = {"$or": [{"classes": c.value} for c in classes]} if classes else None
+        embedding = self._embed_query(query)
         results = self.index.query(
-            embedding, top_k=n * 3, filter=filter  # type: ignore
-        )["matches"]
+            embedding, top_k=n * 3, classes=[c.value for c in classes]
+        )
 
+        embeddings = [e for e in Embedding.get_many(r["id"] for r in results) if e]
+        wanted = {c.value for c in classes}
+        # A fact is attributed to every interview it came from (which matches the filter).
         facts: list[Fact] = [
             {
                 "fact": e.fact,
-                "context": e.document.metadata["summary"],
-                "attributes": ", ".join(
-                    itertools.chain.from_iterable(
-                        e.document.metadata["classes"].values()
-                    )
-                ),
+                "context": doc.metadata["summary"],
+                "attributes": ", ".join(tags),
             }
-            for r in results
-            for e in [Embedding.safe_get(r["id"])]
-            if e
+            for e, docs in zip(embeddings, Embedding.sources(embeddings))
+            for doc in docs
+            if doc
+            for tags in [
+                list(itertools.chain.from_iterable(doc.metadata["classes"].values()))
+            ]
+            if not wanted or wanted.intersection(tags)
         ]
 
-        new_facts = {f["fact"]: f for f in facts if f["fact"] not in self.facts}
-        old_facts = {f["fact"]: f for f in facts if f["fact"] in self.facts}
+        new_facts = {
+            (f["fact"], f["context"]): f for f in facts if f["fact"] not in self.facts
+        }
+        old_facts = {
+            (f["fact"], f["context"]): f for f in facts if f["fact"] in self.facts
+        }
         facts = (list(new_facts.values()) + list(old_facts.values()))[:n]
 
         self.facts.update(f["fact"] for f in facts)
@@ -1,19 +1,24 @@
+import asyncio
 import itertools
+import json
 import logging
 import os
 import re
 import textwrap
+import time
 from abc import ABCMeta
 from collections import defaultdict
 from contextlib import contextmanager
 from contextvars import ContextVar
+from inspect import iscoroutinefunction
 from operator import attrgetter
-from threading import RLock, current_thread
+from threading import RLock, current_thread, local
 from typing import (
     Any,
     Callable,
     ClassVar,
     Iterable,
+    Literal,
     Optional,
     Self,
     Type,
@@ -32,17 +37,24 @@ from langchain.chains import TransformChain
 from langchain.chains.base import Chain as LChain
 from langchain.docstore.document import Document
 from langchain.llms import OpenAI
+from langchain.prompts.base import BasePromptTemplate
+from langchain.schema import LLMResult
 from openai.error import RateLimitError
 from pydantic import BaseModel
-from retry import retry
 from termcolor import colored
 
-from summ.cache.cacher import CacheDocument, ChainCacheItem
+from summ.cache.cacher import CacheItem, ChainCacheItem, StoredDocument
+from summ.shared import limiter
+from summ.shared.flight import SingleFlight
+from summ.shared.limiter import retry_transient
 
 T = TypeVar("T")
 Ts = TypeVarTuple("Ts")
 R = TypeVar("R")
 
+Backend = Literal["threads", "processes", "asyncio"]
+"""The executor backends available to [`Chain._pmap`][summ.shared.chain.Chain._pmap]."""
+
 TDoc = TypeVar("TDoc", bound=Union[Document, list[Document]])
 TExtract = Callable[[TDoc], Union[str, TDoc, dict[str, str], dict[str, TDoc]]]
 
@@ -245,6 +257,22 @@ class Chain:
 
     _n_tokens: ClassVar[int] = 0
 
+    BACKEND: ClassVar[Backend] = "threads"
+    """The default executor backend for parallel operations.
+
+    Use `"processes"` for CPU-bound work (the method and its arguments must be picklable),
+    and `"asyncio"` to gather coroutine methods on an event loop.
+    """
+
+    LEGACY_KEYS: ClassVar[bool] = False
+    """Whether to also look up cached results under the keys of older schemes (from before
+    documents were stored separately, or keys held the prompt). These are moved to their
+    current keys when found. Older results do not record the prompt which produced them,
+    so only enable this to migrate a cache whose prompts have not changed since."""
+
+    flights: ClassVar[SingleFlight[str]] = SingleFlight()
+    """The [`cached`][summ.shared.chain.Chain.cached] calls in flight, shared by every chain."""
+
     @classmethod
     @locked(n_tokens_lock)
     def increment_n_tokens(cls, n: int):
@@ -256,8 +284,9 @@ class Chain:
         return cls._n_tokens
 
     def __init__(self, debug: bool = False, verbose: bool = False):
-        self.llm = OpenAI(temperature=0.0)
+        self.llm = OpenAI(temperature=0.0, max_retries=1)
         self.pool = Parallel(n_jobs=-1, prefer="threads", verbose=10 if verbose else 0)
+        self.pools: dict[Backend, Parallel] = {"threads": self.pool}
         self.verbose = verbose
         self.debug = debug
 
@@ -293,12 +322,35 @@ class Chain:
         return f"[{done}/{total}]" if total else f"[?/{done}]"
 
     def _pmap(
-        self, meth: Callable[[T, *Ts], R], it: Iterable[T], *args: *Ts
+        self,
+        meth: Callable[[T, *Ts], R],
+        it: Iterable[T],
+        *args: *Ts,
+        backend: Optional[Backend] = None,
     ) -> list[R]:
-        return self._parallel(meth, [(x, *args) for x in it])
+        return self._parallel(meth, [(x, *args) for x in it], backend=backend)
+
+    def _parallel(
+        self,
+        meth: Callable[[*Ts], R],
+        it: Iterable[tuple[*Ts]],
+        backend: Optional[Backend] = None,
+    ) -> list[R]:
+        backend = backend or self.BACKEND
+        if backend == "asyncio":
+            return asyncio.run(self._agather(meth, it))
+        if backend not in self.pools:
+            self.pools[backend] = Parallel(
+                n_jobs=-1, prefer=backend, verbose=self.pool.verbose
+            )
+        return self.pools[backend](delayed(meth)(*x) for x in it) or []
 
-    def _parallel(self, meth: Callable[[*Ts], R], it: Iterable[tuple[*Ts]]) -> list[R]:
-        return self.pool(delayed(meth)(*x) for x in it) or []
+    async def _agather(
+        self, meth: Callable[[*Ts], Any], it: Iterable[tuple[*Ts]]
+    ) -> list:
+        if iscoroutinefunction(meth):
+            return await asyncio.gather(*(meth(*x) for x in it))
+        return await asyncio.gather(*(asyncio.to_thread(meth, *x) for x in it))
 
     @classmethod
     def to_chain(cls, method: str) -> TransformChain:
@@ -314,10 +366,144 @@ class Chain:
             transform=transform_func,
         )
 
-    @retry(exceptions=RateLimitError, tries=5, delay=6, jitter=(0, 4))
+    @retry_transient()
     def _run_with_retry(self, chain: LChain, *args, **kwargs):
         return chain.run(*args, **kwargs)
 
+    @staticmethod
+    def _docs(doc: TDoc) -> list[Document]:
+        return doc if isinstance(doc, list) else [doc]
+
+    @staticmethod
+    def _cache_meta(args: Any) -> dict[str, Any]:
+        return (
+            {k: v for k, v in args.items() if not isinstance(v, (list, Document))}
+            if isinstance(args, dict)
+            else {}
+        )
+
+    @classmethod
+    def _prompts(cls, obj: Any) -> Iterable[dict]:
+        if isinstance(obj, BasePromptTemplate):
+            yield obj.dict(exclude={"example_selector"})
+        elif isinstance(obj, LChain):
+            for field in obj.__fields__:
+                yield from cls._prompts(getattr(obj, field))
+        elif isinstance(obj, (list, tuple)):
+            for item in obj:
+                yield from cls._prompts(item)
+
+    @classmethod
+    def fingerprint(cls, chain: LChain) -> str:
+        """A hash of every prompt template (and example) in a chain, including nested chains."""
+
+        return ChainCacheItem._hash(
+            json.dumps(list(cls._prompts(chain)), sort_keys=True, default=str)
+        )
+
+    def _cache_fields(
+        self, name: str, chain: LChain, doc: TDoc, args: Any
+    ) -> dict[str, Any]:
+        docs = self._docs(doc)
+        contents = {d.page_content for d in docs}
+        return dict(
+            klass=self.__class__.__name__,
+            name=name,
+            # Arguments which are the documents themselves are already referenced.
+            meta={k: v for k, v in self._cache_meta(args).items() if v not in contents},
+            documents=[StoredDocument.ref(d.page_content) for d in docs],
+            prompt=self.fingerprint(chain),
+        )
+
+    def _fallback_keys(
+        self, name: str, doc: TDoc, args: Any, fields: dict[str, Any]
+    ) -> list[str]:
+        if not self.LEGACY_KEYS:
+            return []
+        return [
+            ChainCacheItem.unscoped_pk(
+                klass=fields["klass"],
+                name=name,
+                documents=fields["documents"],
+                meta=fields["meta"],
+            ),
+            ChainCacheItem.legacy_pk(
+                klass=fields["klass"],
+                name=name,
+                page_contents=[d.page_content for d in self._docs(doc)],
+                meta=self._cache_meta(args),
+            ),
+        ]
+
+    def cache_keys(
+        self,
+        name: str,
+        chain: LChain,
+        doc: TDoc,
+        extract: TExtract[TDoc] = cast(TExtract[Document], attrgetter("page_content")),
+    ) -> list[str]:
+        """Every key [`cached`][summ.shared.chain.Chain.cached] would look up for these arguments
+        (the current one, then any from older key schemes)."""
+
+        args = extract(doc)
+        fields = self._cache_fields(name, chain, doc, args)
+        key = ChainCacheItem.make_pk(ChainCacheItem.construct(**fields))
+        return [key, *self._fallback_keys(name, doc, args, fields)]
+
+    def cache_key(
+        self,
+        name: str,
+        chain: LChain,
+        doc: TDoc,
+        extract: TExtract[TDoc] = cast(TExtract[Document], attrgetter("page_content")),
+    ) -> str:
+        """The key [`cached`][summ.shared.chain.Chain.cached] would use for these arguments."""
+
+        fields = self._cache_fields(name, chain, doc, extract(doc))
+        return ChainCacheItem.make_pk(ChainCacheItem.construct(**fields))
+
+    def peek(
+        self,
+        name: str,
+        chain: LChain,
+        doc: TDoc,
+        extract: TExtract[TDoc] = cast(TExtract[Document], attrgetter("page_content")),
+    ) -> Optional[str]:
+        """Returns the result [`cached`][summ.shared.chain.Chain.cached] would return
+        from the cache for these arguments, without running (or saving) anything."""
+
+        items = ChainCacheItem.get_many(self.cache_keys(name, chain, doc, extract))
+        return next((item.result for item in items if item and item.result), None)
+
+    def prefetch(
+        self,
+        name: str,
+        chain: LChain,
+        docs: list[TDoc],
+        extract: TExtract[TDoc] = cast(TExtract[Document], attrgetter("page_content")),
+    ):
+        """Loads the cached results for a set of calls in a single round trip,
+        so the [`cached`][summ.shared.chain.Chain.cached] calls which follow are served in-process.
+        """
+
+        ChainCacheItem.get_many(
+            key for doc in docs for key in self.cache_keys(name, chain, doc, extract)
+        )
+
+    @classmethod
+    def invalidate(cls, name: Optional[str] = None, legacy: bool = False) -> int:
+        """Deletes the cached results of this chain, or of one of its stages
+        (the `name` passed to [`cached`][summ.shared.chain.Chain.cached]).
+
+        Args:
+            legacy: Whether to also scan for results saved under older key schemes.
+
+        Returns:
+            The number of results deleted.
+        """
+
+        return ChainCacheItem.invalidate(cls.__name__, name, legacy=legacy)
+
     @overload
     def cached(
         self,
@@ -354,19 +540,19 @@ class Chain:
             extract: A function to extract the arguments from the document.
         """
         args = extract(doc)
-        meta = (
-            {k: v for k, v in args.items() if not isinstance(v, (list, Document))}
-            if isinstance(args, dict)
-            else {}
+        fields = self._cache_fields(name, chain, doc, args)
+        key = ChainCacheItem.make_pk(ChainCacheItem.construct(**fields))
+        # Concurrent callers with the same key (such as identical chunks in different
+        # files) wait for a single call, instead of each missing the cache.
+        return self.flights.do(
+            key, lambda: self._cached(chain, doc, args, name, fields)
         )
 
+    def _cached(
+        self, chain: LChain, doc: TDoc, args: Any, name: str, fields: dict[str, Any]
+    ) -> str:
         item = ChainCacheItem.passthrough(
-            klass=self.__class__.__name__,
-            name=name,
-            meta=meta,
-            document=[CacheDocument.from_doc(d) for d in doc]
-            if isinstance(doc, list)
-            else CacheDocument.from_doc(doc),
+            fallbacks=self._fallback_keys(name, doc, args, fields), **fields
         )
 
         if item.result:
@@ -378,7 +564,16 @@ class Chain:
                 item.result = self._run_with_retry(chain, args)  # type: ignore
             else:
                 item.result = self._run_with_retry(chain, **args)
-            item.save()
+            item.created = time.time()
+            CacheItem.save_many(
+                [
+                    *(
+                        StoredDocument.from_doc(d, metadata=False)
+                        for d in self._docs(doc)
+                    ),
+                    item,
+                ]
+            )
             return item.result
 
 
@@ -394,10 +589,36 @@ class CallbackHandlerMeta(ABCMeta):
 
 
 class CallbackHandler(OpenAICallbackHandler, metaclass=CallbackHandlerMeta):
+    COMPLETION_TOKENS: ClassVar[int] = 256
+    """The number of completion tokens budgeted for each prompt (the default `max_tokens`)."""
+
     def __init__(self, klass: Type["Chain"]) -> None:
         super().__init__()
         self.klass = klass
         self._total_tokens = 0
+        self._estimates = local()
+
+    def on_llm_start(
+        self, serialized: dict[str, Any], prompts: list[str], **kwargs: Any
+    ) -> None:
+        super().on_llm_start(serialized, prompts, **kwargs)
+        self._estimates.tokens = sum(
+            limiter.completions.count_tokens(p) + self.COMPLETION_TOKENS
+            for p in prompts
+        )
+        limiter.completions.acquire(self._estimates.tokens)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        super().on_llm_end(response, **kwargs)
+        estimate = self._estimates.tokens
+        used = (response.llm_output or {}).get("token_usage", {}).get("total_tokens")
+        limiter.completions.release(refund=estimate - (used or estimate))
+
+    def on_llm_error(
+        self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any
+    ) -> None:
+        super().on_llm_error(error, **kwargs)
+        limiter.completions.release(throttled=isinstance(error, RateLimitError))
 
     @property
     def total_tokens(self) -> int:
@@ -0,0 +1,43 @@
+from concurrent.futures import Future
+from threading import Lock
+from typing import Callable, Generic, Hashable, TypeVar
+
+R = TypeVar("R")
+
+
+class SingleFlight(Generic[R]):
+    """Coalesces concurrent calls with the same key into a single call.
+
+    The first caller for a key runs the call. Any caller which arrives while it is
+    still running waits for it, and shares its result (or its exception).
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.calls: dict[Hashable, Future[R]] = {}
+        self.shared = 0
+        """The number of callers which were served by another caller's call."""
+
+    def do(self, key: Hashable, fn: Callable[[], R]) -> R:
+        with self.lock:
+            if (future := self.calls.get(key)) is not None:
+                self.shared += 1
+                leader = False
+            else:
+                future = self.calls[key] = Future()
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
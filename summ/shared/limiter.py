@@ -0,0 +1,176 @@
+import os
+import time
+from contextlib import contextmanager
+from functools import cache
+from threading import Condition
+
+import tiktoken
+from openai.error import (
+    APIConnectionError,
+    APIError,
+    RateLimitError,
+    ServiceUnavailableError,
+    Timeout,
+)
+from retry import retry
+
+TRANSIENT_ERRORS = (
+    RateLimitError,
+    Timeout,
+    APIError,
+    APIConnectionError,
+    ServiceUnavailableError,
+)
+
+
+class RateLimiter:
+    """A process-wide budget of requests and tokens per minute, shared by every thread.
+
+    Both budgets are token buckets which refill continuously. On top of that, the number of
+    requests in flight is adjusted from the throttling we observe: it is halved (and new
+    requests are paused briefly) whenever a request is rate-limited, and creeps back up
+    by one for every round of successful requests.
+    """
+
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        encoding: str,
+        concurrency: int = 64,
+        cooldown: float = 5.0,
+    ):
+        """Creates a new RateLimiter.
+
+        Args:
+            rpm: The number of requests allowed per minute.
+            tpm: The number of tokens allowed per minute.
+            encoding: The tiktoken encoding used to estimate prompt sizes.
+            concurrency: The maximum number of requests in flight.
+            cooldown: How long to pause new requests after being throttled, in seconds.
+        """
+
+        self.rpm = rpm
+        self.tpm = tpm
+        self.encoding = encoding
+        self.max_concurrency = concurrency
+        self.concurrency = float(concurrency)
+        self.cooldown = cooldown
+
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.updated = time.monotonic()
+        self.cond = Condition()
+
+    @classmethod
+    def from_env(cls, prefix: str, rpm: int, tpm: int, encoding: str):
+        return cls(
+            rpm=int(os.environ.get(f"{prefix}_RPM", rpm)),
+            tpm=int(os.environ.get(f"{prefix}_TPM", tpm)),
+            encoding=encoding,
+        )
+
+    def count_tokens(self, text: str) -> int:
+        return len(_encoding(self.encoding).encode(text, disallowed_special=()))
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def _delay(self, tokens: int) -> float:
+        return max(
+            self.paused_until - time.monotonic(),
+            (1 - self.requests) * 60 / self.rpm,
+            (tokens - self.tokens) * 60 / self.tpm,
+            0,
+        )
+
+    def acquire(self, tokens: int = 0):
+        """Blocks until there is budget for one request of roughly `tokens` tokens."""
+
+        tokens = min(tokens, self.tpm)
+        with self.cond:
+            while True:
+                self._refill()
+                delay = self._delay(tokens)
+                if self.in_flight >= int(self.concurrency):
+                    self.cond.wait(delay or None)
+                elif delay:
+                    self.cond.wait(delay)
+                else:
+                    break
+            self.requests -= 1
+            self.tokens -= tokens
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False, refund: int = 0):
+        """Marks a request as finished.
+
+        Args:
+            throttled: Whether the request was rejected for exceeding the rate limit.
+            refund: The number of tokens which were estimated, but not actually used.
+        """
+
+        with self.cond:
+            self.in_flight -= 1
+            self.tokens = min(self.tpm, self.tokens + refund)
+            if throttled:
+                self.concurrency = max(1.0, self.concurrency / 2)
+                self.paused_until = time.monotonic() + self.cooldown
+            else:
+                self.concurrency = min(
+                    self.max_concurrency, self.concurrency + 1 / self.concurrency
+                )
+            self.cond.notify_all()
+
+    @contextmanager
+    def limit(self, tokens: int = 0):
+        """Holds budget for one request for the duration of the block."""
+
+        self.acquire(tokens)
+        try:
+            yield
+        except RateLimitError:
+            self.release(throttled=True)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        else:
+            self.release()
+
+
+@cache
+def _encoding(name: str) -> tiktoken.Encoding:
+    return tiktoken.get_encoding(name)
+
+
+def retry_transient(tries: int = 8):
+    """Retries OpenAI calls which failed transiently.
+
+    There is no long backoff here: once throttled, the shared limiter holds back new requests.
+    """
+
+    return retry(
+        exceptions=TRANSIENT_ERRORS,
+        tries=tries,
+        delay=1,
+        backoff=2,
+        max_delay=10,
+        jitter=(0, 1),
+    )
+
+
+completions = RateLimiter.from_env(
+    "OPENAI_COMPLETIONS", rpm=3_000, tpm=250_000, encoding="p50k_base"
+)
+"""The shared budget for completion calls (configurable with `OPENAI_COMPLETIONS_RPM` and `OPENAI_COMPLETIONS_TPM`)."""
+
+embeddings = RateLimiter.from_env(
+    "OPENAI_EMBEDDINGS", rpm=3_000, tpm=1_000_000, encoding="cl100k_base"
+)
+"""The shared budget for embedding calls (configurable with `OPENAI_EMBEDDINGS_RPM` and `OPENAI_EMBEDDINGS_TPM`)."""
@@ -0,0 +1,40 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, TypeVar, TypeVarTuple
+
+Ts = TypeVarTuple("Ts")
+R = TypeVar("R")
+
+
+class Stages:
+    """Runs blocking pipeline steps from an event loop, with a bounded
+    number of in-flight calls per named stage.
+
+    The underlying clients (langchain, redis-om, pinecone) are synchronous,
+    so each call is handed to a shared executor sized to the sum of the limits.
+    The event loop only ever holds as many calls per stage as its limit allows.
+    """
+
+    def __init__(self, limits: dict[str, int]):
+        self.limits = limits
+        self.semaphores = {k: asyncio.Semaphore(v) for k, v in limits.items()}
+        self.executor = ThreadPoolExecutor(
+            max_workers=sum(limits.values()), thread_name_prefix="summ-stage"
+        )
+
+    async def run(self, stage: str, meth: Callable[[*Ts], R], *args: *Ts) -> R:
+        """Runs `meth(*args)` once a slot for `stage` is free."""
+
+        async with self.semaphores[stage]:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(meth, *args))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await asyncio.to_thread(self.shutdown)
@@ -1,10 +1,14 @@
+from collections import deque
 from pathlib import Path
 from typing import Optional
 
 from langchain.docstore.document import Document
 
+from summ.cache.gc import Collector, CollectReport
 from summ.classify.classes import Classes
 from summ.embed.embedder import Embedder
+from summ.embed.provider import EmbeddingProvider, from_env
+from summ.estimate.estimator import Estimate
 from summ.pipeline import Pipeline
 from summ.query.querier import Querier
 
@@ -12,15 +16,31 @@ from summ.query.querier import Querier
 class Summ:
     """The main entry point for both populating and querying the model."""
 
-    def __init__(self, index: str = "sum-facts", n: int = 3):
+    def __init__(
+        self,
+        index: str = "sum-facts",
+        n: int = 3,
+        provider: Optional[EmbeddingProvider] = None,
+    ):
+        """Creates a new Summ.
+
+        Args:
+            index (str, optional): The name of the vector index to populate and query.
+            n (int, optional): The number of facts to use per sub-query.
+            provider (Optional[EmbeddingProvider], optional): The model to embed facts and queries with.
+                Defaults to the one named by `SUMM_EMBEDDINGS` (see [`from_env`][summ.embed.provider.from_env]).
+        """
         self.index = index
         self.n = n
+        self.provider = provider or from_env()
 
     def populate(
         self,
         path: Path,
         parallel: bool = True,
         pipe: Optional[Pipeline] = None,
+        force: bool = False,
+        resume: bool = False,
     ):
         """Populate the model with data from a given path.
 
@@ -28,8 +48,13 @@ class Summ:
             path (Path): The path to the data (format depends on [Importer][summ.importers.Importer]).
             parallel (bool, optional): Whether to run the pipeline in parallel.
             pipe (Optional[Pipeline], optional): The pipeline to use. If one is not supplied, a default one will be constructed.
+            force (bool, optional): Whether to re-process files that are unchanged since the last run.
+            resume (bool, optional): Whether to continue an interrupted run, skipping any work it completed.
         """
-        pipe = pipe or Pipeline.default(path, self.index)
+        pipe = pipe or Pipeline.default(path, self.index, self.provider)
+
+        if force and pipe.manifest:
+            pipe.manifest.clear()
 
         if not pipe.embedder.has_index():
             try:
@@ -48,7 +73,38 @@ class Summ:
         else:
             pipe.dprint("Index already exists!")
 
-        pipe.run(parallel=parallel)
+        if parallel:
+            deque(pipe.stream(resume=resume), maxlen=0)
+        else:
+            pipe.run(parallel=False, resume=resume)
+
+    def estimate(self, path: Path, pipe: Optional[Pipeline] = None) -> Estimate:
+        """Estimate the cost of populating the model, without calling any models.
+
+        Args:
+            path (Path): The path to the data (format depends on [Importer][summ.importers.Importer]).
+            pipe (Optional[Pipeline], optional): The pipeline to use. If one is not supplied, a default one will be constructed.
+        """
+        pipe = pipe or Pipeline.default(path, self.index, self.provider)
+        return pipe.estimate()
+
+    def gc(
+        self,
+        path: Path,
+        pipe: Optional[Pipeline] = None,
+        max_bytes: Optional[int] = None,
+        dry_run: bool = False,
+    ) -> CollectReport:
+        """Delete cached items which are no longer reachable from the data or the index.
+
+        Args:
+            path (Path): The path to the data (format depends on [Importer][summ.importers.Importer]).
+            pipe (Optional[Pipeline], optional): The pipeline to use. If one is not supplied, a default one will be constructed.
+            max_bytes (Optional[int], optional): A budget for cached chain results, enforced by evicting the oldest.
+            dry_run (bool, optional): Whether to only report what would be deleted.
+        """
+        pipe = pipe or Pipeline.default(path, self.index, self.provider)
+        return Collector(pipe).collect(max_bytes=max_bytes, dry_run=dry_run)
 
     def query(
         self,
@@ -66,9 +122,9 @@ class Summ:
             classes (list[Classes], optional): The set of tags to use as filters (AND).
             debug (bool, optional): Whether to print intermediate steps.
         """
-        if not Embedder(self.index).has_index():
+        if not Embedder(self.index, provider=self.provider).has_index():
             raise Exception(
                 f"Index {self.index} not found! Please run `summ populate` first."
             )
-        querier = Querier(index=self.index, debug=debug)
+        querier = Querier(index=self.index, debug=debug, provider=self.provider)
         return querier.query(question, n=self.n, classes=classes, corpus=corpus)
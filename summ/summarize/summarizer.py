@@ -23,9 +23,21 @@ class Summarizer(Chain):
         chain = load_summarize_chain(self.llm, chain_type="refine")
         return self._summarize("summarize_file", chain, docs)
 
+    def summarize_doc_chain(self) -> LChain:
+        return load_summarize_chain(self.llm, chain_type="stuff")
+
     def summarize_doc(self, doc: Document):
-        chain = load_summarize_chain(self.llm, chain_type="stuff")
-        return self._summarize("summarize_doc", chain, [doc])
+        return self._summarize("summarize_doc", self.summarize_doc_chain(), [doc])
+
+    def prefetch_docs(self, docs: list[Document]):
+        """Loads the cached summaries of a set of documents in a single round trip."""
+
+        self.prefetch(
+            "summarize_doc",
+            self.summarize_doc_chain(),
+            [[doc] for doc in docs],
+            lambda x: x,
+        )
 
     def summarize_facts(self, query: str, docs: list[Document]):
         question_prompt = PromptTemplate(
@@ -0,0 +1,42 @@
+import os
+from pathlib import Path
+from typing import Generator
+
+import pytest
+import tiktoken
+
+from summ.cache import backend
+from summ.cache.backend import SQLiteBackend, set_backend
+
+
+@pytest.fixture(autouse=True)
+def env(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Keeps indices and embeddings local to each test."""
+
+    monkeypatch.setenv("SUMM_INDEX_BACKEND", "local")
+    monkeypatch.setenv("SUMM_INDEX_PATH", str(tmp_path / "index"))
+    monkeypatch.setenv("SUMM_EMBEDDINGS", "hashing")
+    if "OPENAI_API_KEY" not in os.environ:
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path: Path) -> Generator[SQLiteBackend, None, None]:
+    """Points the shared cache at a fresh SQLite file."""
+
+    previous = backend._backend
+    set_backend(cache := SQLiteBackend(tmp_path / "cache.sqlite3"))
+    yield cache
+    set_backend(previous)  # type: ignore
+
+
+class FakeEncoding:
+    """Stands in for a tiktoken encoding, which would otherwise be downloaded."""
+
+    def encode(self, text: str, **_) -> list[str]:
+        return text.split()
+
+
+@pytest.fixture
+def offline_encoding(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda _: FakeEncoding())
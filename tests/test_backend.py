@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import pytest
+
+from summ.cache.backend import SQLiteBackend
+
+
+class TestSQLiteBackend:
+    @pytest.fixture
+    def backend(self, tmp_path: Path) -> SQLiteBackend:
+        return SQLiteBackend(tmp_path / "cache.sqlite3")
+
+    def test_round_trip(self, backend: SQLiteBackend):
+        backend.set_many([("p:a", {"x": 1}), ("p:b", {"y": [2]})])
+        assert backend.get_many(["p:b", "missing", "p:a"]) == [
+            {"y": [2]},
+            None,
+            {"x": 1},
+        ]
+
+        backend.set_many([("p:a", {"x": 3})])
+        assert backend.get_many(["p:a"]) == [{"x": 3}]
+
+    def test_persists(self, backend: SQLiteBackend):
+        backend.set_many([("p:a", {"x": 1})])
+        assert SQLiteBackend(backend.path).get_many(["p:a"]) == [{"x": 1}]
+
+    def test_keys_and_scan(self, backend: SQLiteBackend):
+        backend.set_many([("p:a", {}), ("p:b", {}), ("q:a", {})])
+        assert sorted(backend.keys("p:")) == ["p:a", "p:b"]
+        assert dict(backend.scan("q:", batch_size=1)) == {"q:a": {}}
+
+    def test_delete(self, backend: SQLiteBackend):
+        backend.set_many([("p:a", {}), ("p:b", {})])
+        assert backend.delete_many(["p:a", "missing"]) == 1
+        assert list(backend.keys("p:")) == ["p:b"]
+
+    def test_batches(self, backend: SQLiteBackend):
+        keys = [f"p:{i}" for i in range(SQLiteBackend.BATCH_SIZE * 2 + 1)]
+        backend.set_many([(key, {"i": i}) for i, key in enumerate(keys)])
+        assert [doc["i"] for doc in backend.get_many(keys)] == list(range(len(keys)))
+        assert backend.delete_many(keys) == len(keys)
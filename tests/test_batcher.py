@@ -0,0 +1,63 @@
+from concurrent.futures import wait
+from typing import Optional
+
+import pytest
+from langchain.embeddings.base import Embeddings
+
+from summ.embed.batcher import EmbeddingBatcher
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeds each text as its length, recording every call."""
+
+    def __init__(self, error: Optional[Exception] = None):
+        self.calls: list[list[str]] = []
+        self.error = error
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls.append(texts)
+        if self.error:
+            raise self.error
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class TestEmbeddingBatcher:
+    def test_flushes_full_batches(self):
+        embeddings = FakeEmbeddings()
+        batcher = EmbeddingBatcher(embeddings, max_size=3, max_wait=60)
+
+        futures = [batcher.submit(text) for text in ("a", "bb", "ccc")]
+        done, _ = wait(futures, timeout=5)
+        assert len(done) == 3
+        assert [f.result() for f in futures] == [[1.0], [2.0], [3.0]]
+        assert embeddings.calls == [["a", "bb", "ccc"]]
+
+    def test_flushes_old_batches(self):
+        embeddings = FakeEmbeddings()
+        batcher = EmbeddingBatcher(embeddings, max_size=100, max_wait=0.05)
+
+        futures = [batcher.submit(text) for text in ("a", "bb")]
+        done, _ = wait(futures, timeout=5)
+        assert len(done) == 2
+        assert embeddings.calls == [["a", "bb"]]
+
+    def test_embeds_duplicates_once(self):
+        embeddings = FakeEmbeddings()
+        batcher = EmbeddingBatcher(embeddings, max_size=3, max_wait=60)
+
+        futures = [batcher.submit(text) for text in ("a", "bb", "a")]
+        assert [f.result(timeout=5) for f in futures] == [[1.0], [2.0], [1.0]]
+        assert embeddings.calls == [["a", "bb"]]
+
+    def test_fails_every_future(self):
+        embeddings = FakeEmbeddings(error=ValueError("boom"))
+        batcher = EmbeddingBatcher(embeddings, max_size=3, max_wait=60)
+
+        futures = [batcher.submit(text) for text in ("a", "bb", "a")]
+        for future in futures:
+            with pytest.raises(ValueError, match="boom"):
+                future.result(timeout=5)
+        assert embeddings.calls == [["a", "bb"]]
@@ -0,0 +1,57 @@
+import pytest
+
+from summ.embed.embedder import Embedder, Embedding
+from summ.embed.provider import HashingProvider
+
+
+class TestParseQueries:
+    @pytest.fixture
+    def embedder(self) -> Embedder:
+        return Embedder("test-parse", provider=HashingProvider(dims=8))
+
+    def test_groups_by_fact(self, embedder: Embedder):
+        results = "1. Why cats?\n 2) Why dogs?\n3: Why mice?\nnot a question"
+        assert embedder.parse_queries(results, ["cats", "dogs", "mice"]) == [
+            ["Why cats?"],
+            ["Why dogs?"],
+            ["Why mice?"],
+        ]
+
+    def test_skips_unknown_facts_and_extra_queries(self, embedder: Embedder):
+        results = "1. First?\n1. Second?\n7. Unknown?\n0. Zero?"
+        assert embedder.parse_queries(results, ["a", "b"]) == [["First?"], []]
+
+
+class TestPostings:
+    @pytest.fixture
+    def embedding(self) -> Embedding:
+        return Embedding.construct(
+            doc="a0", query="q", fact="q", vector="", postings={}, chunks={}
+        )
+
+    def test_new_version_replaces_old(self, embedding: Embedding):
+        embedding.post("a0", ["x"], "a:0")
+        embedding.post("b0", ["y"], "b:0")
+        embedding.post("b0v2", ["z"], "b:0")
+        assert embedding.postings == {"a0": ["x"], "b0v2": ["z"]}
+        assert embedding.classes == ["x", "z"]
+
+    def test_shared_content_survives(self, embedding: Embedding):
+        embedding.post("same", ["x"], "c:0")
+        embedding.post("same", ["x"], "c:1")
+        embedding.post("other", ["x"], "c:1")
+        assert set(embedding.postings) == {"same", "other"}
+
+    def test_unpost(self, embedding: Embedding):
+        embedding.post("a0", ["x"], "a:0")
+        embedding.post("b1", ["y"], "b:1")
+        assert not embedding.unpost(["b:2"])
+        assert embedding.unpost(["b:1"])
+        assert embedding.postings == {"a0": ["x"]}
+        assert embedding.chunks == {"a:0": "a0"}
+
+    def test_unsourced_postings_are_kept(self, embedding: Embedding):
+        embedding.post("legacy", ["x"])
+        embedding.post("b0", ["y"], "b:0")
+        embedding.unpost(["b:0"])
+        assert embedding.postings == {"legacy": ["x"]}
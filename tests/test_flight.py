@@ -0,0 +1,64 @@
+import time
+from threading import Barrier, Event, Thread
+
+from summ.shared.flight import SingleFlight
+
+
+class TestSingleFlight:
+    def test_coalesces_concurrent_calls(self):
+        flights: SingleFlight[int] = SingleFlight()
+        started, release = Event(), Event()
+        calls, results = [], []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return 42
+
+        def call():
+            results.append(flights.do("key", fn))
+
+        leader = Thread(target=call)
+        leader.start()
+        started.wait()
+        followers = [Thread(target=call) for _ in range(4)]
+        for t in followers:
+            t.start()
+        while flights.shared < len(followers):
+            time.sleep(0.001)
+        release.set()
+        for t in [leader, *followers]:
+            t.join()
+
+        assert calls == [1]
+        assert results == [42] * 5
+        assert not flights.calls
+
+    def test_shares_exceptions(self):
+        flights: SingleFlight[int] = SingleFlight()
+        barrier = Barrier(2)
+        errors = []
+
+        def fn():
+            raise ValueError("boom")
+
+        def call():
+            barrier.wait()
+            try:
+                flights.do("key", fn)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [Thread(target=call) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(errors) == 2
+
+    def test_sequential_calls_run_again(self):
+        flights: SingleFlight[int] = SingleFlight()
+        assert flights.do("key", lambda: 1) == 1
+        assert flights.do("key", lambda: 2) == 2
+        assert flights.shared == 0
@@ -0,0 +1,183 @@
+import json
+from pathlib import Path
+from typing import Optional
+
+import pytest
+from langchain.chains import LLMChain
+from langchain.docstore.document import Document
+from langchain.llms.base import LLM
+
+from summ.cache.backend import SQLiteBackend
+from summ.cache.cacher import CacheItem, ChainCacheItem, StoredDocument
+from summ.cache.gc import Collector
+from summ.classify.classifier import Classifier
+from summ.embed.embedder import Embedder, Embedding
+from summ.importers.importer import Importer
+from summ.importers.journal import Journal
+from summ.importers.manifest import Manifest
+from summ.pipeline import Pipeline
+
+
+class FakeLLM(LLM):
+    """Answers each prompt of the pipeline from the prompt itself."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _call(self, prompt: str, stop: Optional[list[str]] = None) -> str:
+        if "Paragraph:" in prompt:
+            chunk = prompt.rsplit("Paragraph:", 1)[1].split("Facts:")[0].strip()
+            return f"{chunk} is a fact.\n\nContext:\nAfter {chunk}"
+        if "numbered facts" in prompt:
+            return "1. What is the fact?"
+        return "A summary."
+
+
+class TestCollector:
+    @pytest.fixture
+    def corpus(self, tmp_path: Path) -> Path:
+        corpus = tmp_path / "corpus"
+        corpus.mkdir()
+        (corpus / "a.txt").write_text("alpha one\n\nalpha two")
+        (corpus / "b.txt").write_text("beta one")
+        return corpus
+
+    @pytest.fixture
+    def pipeline(
+        self, corpus: Path, offline_encoding, monkeypatch: pytest.MonkeyPatch
+    ) -> Pipeline:
+        monkeypatch.setattr(Classifier, "classifiers", {})
+        pipeline = Pipeline(
+            importer=Importer(corpus),
+            embedder=Embedder("test"),
+            manifest=Manifest.default(corpus, "test"),
+            journal=Journal.default(corpus, "test"),
+            persist=True,
+        )
+        pipeline.embedder.create_index()
+        llm = FakeLLM()
+        pipeline.factifier.llm = pipeline.summarizer.llm = llm
+        pipeline.embedder.query_chain = LLMChain(
+            llm=llm, prompt=Embedder.QUERY_TEMPLATE
+        )
+        return pipeline
+
+    @staticmethod
+    def keys(cls: type[CacheItem]) -> set[str]:
+        return set(cls.all_pks())
+
+    def test_populated_cache_is_live(self, pipeline: Pipeline):
+        pipeline.run(parallel=False)
+        report = Collector(pipeline).collect()
+        assert {name: c.deleted for name, c in report.types.items()} == {
+            "Embedding": 0,
+            "ChainCacheItem": 0,
+            "StoredDocument": 0,
+        }
+
+    def test_requires_a_manifest(self, pipeline: Pipeline):
+        with pytest.raises(ValueError):
+            Collector(pipeline).collect()
+
+    def test_embeddings(self, pipeline: Pipeline):
+        recorded, journaled, dead = (
+            Embedding(doc="d", query=q, fact=q, vector=Embedding.pack([1.0]))
+            for q in ("recorded", "journaled", "dead")
+        )
+        CacheItem.save_many([recorded, journaled, dead])
+        pipeline.manifest.record("a", "hash", [recorded.pk])
+        pipeline.journal.open()
+        pipeline.journal.mark(
+            Document(page_content="", metadata={"file": "b", "chunk": 0}),
+            "embedded",
+            ids=[journaled.pk],
+        )
+        pipeline.journal.close()
+
+        report = Collector(pipeline).collect()
+        assert report.types["Embedding"].deleted == 1
+        assert self.keys(Embedding) == {recorded.pk, journaled.pk}
+
+    def test_dry_run(self, pipeline: Pipeline):
+        pipeline.run(parallel=False)
+        dead = Embedding(doc="d", query="dead", fact="dead", vector="")
+        CacheItem.save_many([dead])
+
+        report = Collector(pipeline).collect(dry_run=True)
+        assert report.types["Embedding"].deleted == 1
+        assert dead.pk in self.keys(Embedding)
+
+    def test_follows_the_factify_context(self, pipeline: Pipeline, corpus: Path):
+        pipeline.run(parallel=False)
+        before = {i.pk: i for i in ChainCacheItem.get_many(self.keys(ChainCacheItem))}
+
+        # The second chunk is unchanged, but is factified in a new context.
+        (corpus / "a.txt").write_text("alpha uno\n\nalpha two")
+        pipeline.run(parallel=False)
+        collector = Collector(pipeline)
+        live = collector.live_results()
+        collector.collect()
+
+        remaining = self.keys(ChainCacheItem)
+        assert remaining <= live
+        gone = {
+            (item.name, item.documents[0])
+            for pk, item in before.items()
+            if item and pk not in remaining
+        }
+        assert gone == {
+            ("factify", StoredDocument.ref("alpha one")),
+            ("factify", StoredDocument.ref("alpha two")),
+            ("summarize_doc", StoredDocument.ref("alpha one")),
+            ("generate_queries", StoredDocument.ref("alpha one")),
+        }
+
+    def test_placeholders(self, pipeline: Pipeline, cache: SQLiteBackend):
+        pipeline.run(parallel=False)
+        placeholder = {"pk": "p", "klass": "Other", "name": "run", "result": None}
+        cache.set_many([(ChainCacheItem.make_primary_key("p"), placeholder)])
+
+        Collector(pipeline).collect()
+        assert "p" not in self.keys(ChainCacheItem)
+
+    def test_evicts_oldest_within_budget(
+        self, pipeline: Pipeline, cache: SQLiteBackend
+    ):
+        pipeline.run(parallel=False)
+        populated = self.keys(ChainCacheItem)
+        items = {
+            pk: {"pk": pk, "klass": "Other", "result": "x" * 100, "created": t}
+            for pk, t in [("1", 1e12), ("2", 2e12), ("3", 3e12)]
+        }
+        cache.set_many(
+            [(ChainCacheItem.make_primary_key(k), v) for k, v in items.items()]
+        )
+
+        # Populated results are older than all of these, so they go first.
+        Collector(pipeline).collect(max_bytes=2 * len(json.dumps(items["1"])))
+        assert self.keys(ChainCacheItem) == {"2", "3"}
+        assert not populated & self.keys(ChainCacheItem)
+
+    def test_keeps_referenced_documents(self, pipeline: Pipeline):
+        pipeline.run(parallel=False)
+        other, unreferenced = CacheItem.save_many(
+            [StoredDocument(page_content="other"), StoredDocument(page_content="none")]
+        )
+        CacheItem.save_many(
+            [
+                ChainCacheItem(
+                    klass="Other", name="run", documents=[other.pk], meta={}, result="x"
+                )
+            ]
+        )
+
+        Collector(pipeline).collect()
+        docs = self.keys(StoredDocument)
+        assert other.pk in docs
+        assert unreferenced.pk not in docs
+
+        for item in ChainCacheItem.get_many(self.keys(ChainCacheItem)):
+            assert item and set(item.documents) <= docs
+        for embedding in Embedding.get_many(self.keys(Embedding)):
+            assert embedding and set(embedding.refs) <= docs
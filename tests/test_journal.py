@@ -0,0 +1,65 @@
+from pathlib import Path
+
+import pytest
+from langchain.docstore.document import Document
+
+from summ.importers.journal import Journal
+
+
+class TestJournal:
+    @pytest.fixture
+    def journal(self, tmp_path: Path) -> Journal:
+        return Journal(tmp_path / "idx.journal.jsonl")
+
+    @staticmethod
+    def doc(file: str, chunk: int) -> Document:
+        return Document(
+            page_content=f"{file} {chunk}", metadata={"file": file, "chunk": chunk}
+        )
+
+    def test_round_trip(self, journal: Journal):
+        a, b = self.doc("a", 0), self.doc("b", 0)
+        journal.open()
+        journal.mark(a, "factified", facts=["f"], context="c")
+        journal.mark(b, "embedded", ids=["x"])
+        journal.close()
+
+        resumed = Journal(journal.path)
+        resumed.open(resume=True)
+        assert resumed.get(a, "factified") == {"facts": ["f"], "context": "c"}
+        assert resumed.get(b, "embedded") == {"ids": ["x"]}
+        assert resumed.get(a, "summarized") is None
+        resumed.close()
+
+    def test_fresh_run_truncates(self, journal: Journal):
+        journal.open()
+        journal.mark(self.doc("a", 0), "factified", facts=[], context="")
+        journal.open(resume=False)
+        journal.close()
+        journal.read()
+        assert not journal.entries
+
+    def test_truncated_line(self, journal: Journal):
+        journal.open()
+        journal.mark(self.doc("a", 0), "summarized", summary="s")
+        journal.close()
+        with journal.path.open("a") as f:
+            f.write('{"doc": "a:1:')
+
+        journal.read()
+        assert journal.get(self.doc("a", 0), "summarized") == {"summary": "s"}
+
+    def test_discard(self, journal: Journal):
+        a, b = self.doc("a", 0), self.doc("b", 1)
+        journal.open()
+        journal.mark(a, "upserted")
+        journal.mark(b, "upserted")
+        journal.close()
+
+        journal.discard({"a"})
+        journal.read()
+        assert journal.get(a, "upserted") is None
+        assert journal.get(b, "upserted") == {}
+
+        journal.discard({"b"})
+        assert not journal.path.exists()
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from summ.shared.limiter import RateLimiter
+
+
+class TestRateLimiter:
+    @pytest.fixture
+    def limiter(self) -> RateLimiter:
+        return RateLimiter(rpm=600, tpm=1000, encoding="cl100k_base", concurrency=4)
+
+    def test_spends_budget(self, limiter: RateLimiter):
+        with limiter.limit(100):
+            assert limiter.in_flight == 1
+            assert limiter.tokens == pytest.approx(900, abs=5)
+        assert limiter.in_flight == 0
+
+    def test_refund(self, limiter: RateLimiter):
+        limiter.acquire(500)
+        limiter.release(refund=400)
+        assert limiter.tokens == pytest.approx(900, abs=5)
+
+    def test_throttling_halves_concurrency(self, limiter: RateLimiter):
+        limiter.acquire()
+        limiter.release(throttled=True)
+        assert limiter.concurrency == 2
+        assert limiter.paused_until > time.monotonic()
+
+    def test_success_grows_concurrency(self, limiter: RateLimiter):
+        limiter.concurrency = 2
+        # Acquiring would wait out a pause, so only the release is exercised.
+        limiter.in_flight = 1
+        limiter.release()
+        assert limiter.concurrency == 2.5
+        assert limiter.in_flight == 0
+
+    def test_waits_for_budget(self):
+        limiter = RateLimiter(rpm=60_000, tpm=60_000, encoding="cl100k_base")
+        limiter.acquire(60_000)
+        limiter.release()
+
+        start = time.monotonic()
+        limiter.acquire(100)
+        assert time.monotonic() - start >= 0.05
+        limiter.release()
+
+    def test_releases_on_error(self, limiter: RateLimiter):
+        with pytest.raises(RuntimeError):
+            with limiter.limit():
+                raise RuntimeError
+        assert limiter.in_flight == 0
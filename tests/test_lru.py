@@ -0,0 +1,49 @@
+from summ.cache.lru import LRUCache
+
+
+class TestLRUCache:
+    def test_hits_and_misses(self):
+        lru: LRUCache[str] = LRUCache(max_items=10, max_bytes=100)
+        lru.put("a", "A", 1)
+        assert lru.get("a") == "A"
+        assert lru.get("b") is None
+
+        stats = lru.stats()
+        assert (stats.hits, stats.misses, stats.items, stats.bytes) == (1, 1, 1, 1)
+        assert stats.hit_rate == 0.5
+
+    def test_evicts_least_recently_used(self):
+        lru: LRUCache[str] = LRUCache(max_items=2, max_bytes=100)
+        lru.put("a", "A", 1)
+        lru.put("b", "B", 1)
+        lru.get("a")
+        lru.put("c", "C", 1)
+        assert lru.get("b") is None
+        assert lru.get("a") == "A"
+        assert lru.stats().evictions == 1
+
+    def test_bounded_by_size(self):
+        lru: LRUCache[str] = LRUCache(max_items=10, max_bytes=10)
+        lru.put("a", "A", 6)
+        lru.put("b", "B", 6)
+        assert lru.get("a") is None
+        assert lru.stats().bytes == 6
+
+        lru.put("huge", "H", 11)
+        assert lru.get("huge") is None
+
+    def test_replace_and_discard(self):
+        lru: LRUCache[str] = LRUCache(max_items=10, max_bytes=100)
+        lru.put("a", "A", 5)
+        lru.put("a", "A2", 3)
+        assert lru.get("a") == "A2"
+        assert lru.stats().bytes == 3
+
+        lru.discard("a")
+        assert lru.get("a") is None
+        assert lru.stats().bytes == 0
+
+    def test_disabled(self):
+        lru: LRUCache[str] = LRUCache(max_items=0, max_bytes=100)
+        lru.put("a", "A", 1)
+        assert lru.get("a") is None
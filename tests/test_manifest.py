@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+
+from summ.importers.manifest import Manifest
+
+
+class TestManifest:
+    @pytest.fixture
+    def path(self, tmp_path: Path) -> Path:
+        return tmp_path / "idx.manifest.json"
+
+    def test_round_trip(self, path: Path):
+        manifest = Manifest(path)
+        assert manifest.record("a", "h1", ["x", "y"]) == []
+        assert manifest.record("b", "h2", ["y", "z"]) == []
+
+        reloaded = Manifest(path)
+        assert reloaded.is_fresh("a", "h1")
+        assert not reloaded.is_fresh("a", "other")
+        assert not reloaded.is_fresh("c", "h1")
+        assert reloaded.get("b").ids == ["y", "z"]
+
+    def test_stale_ids(self, path: Path):
+        manifest = Manifest(path)
+        manifest.record("a", "h1", ["x", "y"])
+        manifest.record("b", "h2", ["y"])
+        # "y" is still produced by "b", so only "x" is stale.
+        assert manifest.record("a", "h3", ["w"]) == ["x"]
+
+    def test_clear(self, path: Path):
+        manifest = Manifest(path)
+        manifest.record("a", "h1", ["x"])
+        manifest.clear()
+        assert Manifest(path).entries == {}
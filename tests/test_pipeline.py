@@ -0,0 +1,30 @@
+from pathlib import Path
+from threading import Lock
+
+import pytest
+
+from summ.embed.embedder import Embedder
+from summ.importers.importer import Importer
+from summ.pipeline import Pipeline
+
+
+class TestSplitBackend:
+    @pytest.fixture
+    def pipeline(self, tmp_path: Path, offline_encoding) -> Pipeline:
+        return Pipeline(importer=Importer(tmp_path), embedder=Embedder("test"))
+
+    def test_default_splitter_uses_processes(self, pipeline: Pipeline):
+        assert pipeline._split_backend() == "processes"
+
+    def test_unpicklable_splitter_uses_threads(self, pipeline: Pipeline):
+        pipeline.splitter.lock = Lock()  # type: ignore
+        assert pipeline._split_backend() == "threads"
+
+    def test_splits_on_processes(self, pipeline: Pipeline, tmp_path: Path):
+        (tmp_path / "a.txt").write_text("one two\n\nthree")
+        [docs] = pipeline._split_blobs(pipeline.importer.blobs, "processes")
+        assert [doc.page_content for doc in docs] == ["one two", "three"]
+        assert [doc.metadata for doc in docs] == [
+            {"file": "a", "chunk": 0},
+            {"file": "a", "chunk": 1},
+        ]
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from summ.embed.provider import HashingProvider
+
+
+class TestHashingProvider:
+    def test_dimensions(self):
+        provider = HashingProvider(dims=64)
+        vectors = np.array(provider.embed_documents(["one fact", "another", ""]))
+        assert vectors.shape == (3, 64)
+        assert np.linalg.norm(vectors[:2], axis=1) == pytest.approx([1, 1], abs=1e-5)
+        assert not vectors[2].any()
+        assert len(provider.embed_query("one fact")) == 64
+
+    def test_deterministic(self):
+        texts = ["The user likes cats", "Revenue grew"]
+        assert HashingProvider().embed_documents(texts) == (
+            HashingProvider().embed_documents(texts)
+        )
+        assert HashingProvider().embed_query(texts[0]) == (
+            HashingProvider().embed_documents(texts[:1])[0]
+        )
+
+    def test_similarity(self):
+        a, b, c = np.array(
+            HashingProvider().embed_documents(
+                ["The user likes cats", "user likes cats", "Quarterly revenue grew"]
+            )
+        )
+        assert a @ b > a @ c
+
+    def test_scope(self):
+        assert HashingProvider(dims=64).scope != HashingProvider(dims=128).scope
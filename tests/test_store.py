@@ -0,0 +1,142 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pinecone
+import pytest
+
+from summ.embed import store as stores
+from summ.embed.store import LocalStore, PineconeStore
+
+
+class TestLocalStore:
+    DIMS = 16
+
+    @pytest.fixture
+    def vectors(self) -> np.ndarray:
+        return np.random.default_rng(0).normal(size=(200, self.DIMS))
+
+    def store(self, root: Path, **kwargs) -> LocalStore:
+        return LocalStore("test", self.DIMS, root, **kwargs)
+
+    def fill(self, store: LocalStore, vectors: np.ndarray):
+        store.create()
+        store.upsert(
+            [
+                (f"id{i}", v.tolist(), {"classes": ["even" if i % 2 else "odd"]})
+                for i, v in enumerate(vectors)
+            ]
+        )
+
+    def test_query(self, tmp_path: Path, vectors: np.ndarray):
+        store = self.store(tmp_path)
+        self.fill(store, vectors)
+
+        [match] = store.query(vectors[7].tolist(), top_k=1)
+        assert match["id"] == "id7"
+        assert match["score"] == pytest.approx(1.0)
+        assert all(
+            int(m["id"][2:]) % 2
+            for m in store.query(vectors[8].tolist(), top_k=5, classes=["even"])
+        )
+
+    def test_quantized_query_delete_and_reload(
+        self, tmp_path: Path, vectors: np.ndarray
+    ):
+        store = self.store(tmp_path, quantize="int8")
+        self.fill(store, vectors)
+        assert store.query(vectors[3].tolist(), top_k=1)[0]["id"] == "id3"
+
+        store.delete(["id3"])
+        store.flush()
+        assert "id3" not in {m["id"] for m in store.query(vectors[3].tolist(), 10)}
+
+        reloaded = self.store(tmp_path)
+        assert reloaded.quantize == "int8"
+        assert reloaded.dims == self.DIMS
+        assert "id3" not in reloaded.ids
+        assert reloaded.query(vectors[4].tolist(), top_k=1)[0]["id"] == "id4"
+
+    def test_scores_in_blocks(
+        self, tmp_path: Path, vectors: np.ndarray, monkeypatch: pytest.MonkeyPatch
+    ):
+        store = self.store(tmp_path, quantize="int8")
+        self.fill(store, vectors)
+        q = vectors[11].tolist()
+        expected = store.query(q, top_k=5)
+
+        monkeypatch.setattr(LocalStore, "BLOCK", 7)
+        blocked = store.query(q, top_k=5)
+        assert [m["id"] for m in blocked] == [m["id"] for m in expected]
+        assert [m["score"] for m in blocked] == pytest.approx(
+            [m["score"] for m in expected], abs=1e-5
+        )
+        assert all(
+            int(m["id"][2:]) % 2 == 0 for m in store.query(q, top_k=5, classes=["odd"])
+        )
+
+    def test_approximate_reload_after_delete(
+        self, tmp_path: Path, vectors: np.ndarray, monkeypatch: pytest.MonkeyPatch
+    ):
+        pytest.importorskip("hnswlib")
+        monkeypatch.setattr(LocalStore, "EXACT_BELOW", 0)
+        store = self.store(tmp_path, approximate=True)
+        self.fill(store, vectors)
+        store.graph
+        store.flush()
+        # Not flushed, so the saved graph is stale.
+        store.delete(["id5"])
+
+        matches = self.store(tmp_path, approximate=True).query(vectors[5].tolist(), 5)
+        assert all(m["id"] for m in matches)
+        assert "id5" not in {m["id"] for m in matches}
+
+    def test_grows(self, tmp_path: Path):
+        store = self.store(tmp_path)
+        store.create()
+        vectors = np.eye(self.DIMS).repeat(100, axis=0) + 0.01
+        store.upsert([(f"id{i}", v.tolist(), {}) for i, v in enumerate(vectors)])
+        assert store.capacity >= len(vectors)
+        assert len(self.store(tmp_path).ids) == len(vectors)
+
+    def test_checks_dims_on_use(self, tmp_path: Path, vectors: np.ndarray):
+        self.fill(self.store(tmp_path), vectors)
+
+        store = LocalStore("test", self.DIMS * 2, tmp_path)
+        with pytest.raises(ValueError):
+            store.query(np.ones(self.DIMS * 2).tolist(), top_k=1)
+
+
+class TestGetStore:
+    @pytest.fixture(autouse=True)
+    def described(self, monkeypatch: pytest.MonkeyPatch) -> list[str]:
+        described: list[str] = []
+        monkeypatch.setenv("SUMM_INDEX_BACKEND", PineconeStore.name)
+        monkeypatch.setattr(stores, "_stores", {})
+        monkeypatch.setattr(
+            pinecone,
+            "describe_index",
+            lambda name: described.append(name) or SimpleNamespace(dimension=1536),
+        )
+        return described
+
+    def test_opens_without_requests(self, described: list[str]):
+        store = stores.get_store("test", 1024)
+        assert isinstance(store, PineconeStore)
+        assert described == []
+
+    def test_checks_dims_once(self, described: list[str]):
+        store = stores.get_store("test", 1024)
+        with pytest.raises(ValueError):
+            store.upsert([("id", [0.0] * 1024, {})])
+
+        store = stores.get_store("other", 1536)
+        store.index = SimpleNamespace(upsert=lambda vectors: None)  # type: ignore
+        store.upsert([])
+        store.upsert([])
+        assert described == ["test", "other"]
+
+    def test_shared_within_process(self):
+        assert stores.get_store("test", 1536) is stores.get_store("test", 1536)
+        with pytest.raises(ValueError):
+            stores.get_store("test", 1024)
@@ -0,0 +1,105 @@
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from summ.cache.backend import SQLiteBackend, set_backend
+from summ.cache.cacher import CacheItem, ChainCacheItem, StoredDocument
+from summ.cache.transfer import export_items, import_items
+from summ.embed.embedder import Embedding
+
+
+class TestTransfer:
+    @pytest.fixture
+    def docs(self) -> dict[str, StoredDocument]:
+        docs = CacheItem.save_many(
+            [
+                StoredDocument(page_content=text)
+                for text in ("facts", "summary", "embedded", "unreferenced")
+            ]
+        )
+        return {doc.page_content: doc for doc in docs}
+
+    @pytest.fixture
+    def items(
+        self, docs: dict[str, StoredDocument], cache: SQLiteBackend
+    ) -> dict[str, CacheItem]:
+        factify, summarize = (
+            ChainCacheItem(
+                klass=klass, name=name, documents=[docs[text].pk], meta={}, result=r
+            )
+            for klass, name, text, r in [
+                ("Factifier", "factify", "facts", "A fact."),
+                ("Summarizer", "summarize_doc", "summary", "A summary."),
+            ]
+        )
+        embedding = Embedding(
+            doc=docs["embedded"].pk,
+            query="q",
+            fact="f",
+            vector=Embedding.pack([1.0, 2.0]),
+        )
+        CacheItem.save_many([factify, summarize, embedding])
+        placeholder = {"pk": "p", "klass": "Summarizer", "result": None}
+        cache.set_many([(ChainCacheItem.make_primary_key("p"), placeholder)])
+        return {"factify": factify, "summarize": summarize, "embedding": embedding}
+
+    @staticmethod
+    def contents(cache: SQLiteBackend) -> dict[str, dict]:
+        return dict(cache.scan(""))
+
+    @staticmethod
+    def exported(path: Path) -> set[tuple[str, str]]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return {(name, doc["pk"]) for name, doc in map(json.loads, f)}
+
+    def test_round_trip(self, tmp_path: Path, cache: SQLiteBackend, items, docs):
+        path = tmp_path / "cache.jsonl.gz"
+        counts = export_items(path, batch_size=1)
+        assert counts == {"ChainCacheItem": 2, "Embedding": 1, "StoredDocument": 3}
+
+        # Placeholders and unreferenced documents are left behind.
+        expected = {
+            key: doc
+            for key, doc in self.contents(cache).items()
+            if doc.get("result", "") is not None
+            and key != StoredDocument.make_primary_key(docs["unreferenced"].pk)
+        }
+
+        set_backend(empty := SQLiteBackend(tmp_path / "empty.sqlite3"))
+        try:
+            assert import_items(path, batch_size=2) == counts
+            assert self.contents(empty) == expected
+        finally:
+            set_backend(cache)
+
+    def test_filters(self, tmp_path: Path, items, docs):
+        path = tmp_path / "cache.jsonl.gz"
+
+        export_items(path, klasses=["Factifier"], embeddings=False)
+        assert self.exported(path) == {
+            ("ChainCacheItem", items["factify"].pk),
+            ("StoredDocument", docs["facts"].pk),
+        }
+
+        export_items(path, names=["summarize_doc"], embeddings=False)
+        assert self.exported(path) == {
+            ("ChainCacheItem", items["summarize"].pk),
+            ("StoredDocument", docs["summary"].pk),
+        }
+
+        export_items(path, klasses=["Factifier"], names=["summarize_doc"])
+        assert self.exported(path) == {
+            ("Embedding", items["embedding"].pk),
+            ("StoredDocument", docs["embedded"].pk),
+        }
+
+    def test_rejects_unknown_types(self, tmp_path: Path, cache: SQLiteBackend):
+        path = tmp_path / "cache.jsonl.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(["ChainCacheItem", {"pk": "a", "result": "x"}]) + "\n")
+            f.write(json.dumps(["Other", {"pk": "b"}]) + "\n")
+
+        with pytest.raises(ValueError, match="Other"):
+            import_items(path)
@@ -0,0 +1,89 @@
+from concurrent.futures import wait
+from threading import Event, Thread
+from typing import Optional
+
+import pytest
+
+from summ.embed.writer import Vector, VectorWriter
+
+
+class FakeStore:
+    """Records every upsert, optionally blocking or failing them."""
+
+    def __init__(self, error: Optional[Exception] = None):
+        self.upserts: list[list[str]] = []
+        self.error = error
+        self.release = Event()
+        self.release.set()
+
+    def upsert(self, vectors: list[Vector]):
+        self.release.wait()
+        if self.error:
+            raise self.error
+        self.upserts.append([key for key, _, _ in vectors])
+
+
+def vectors(*ids: str) -> list[Vector]:
+    return [(key, [1.0], {}) for key in ids]
+
+
+class TestVectorWriter:
+    def test_writes_full_batches(self):
+        store = FakeStore()
+        writer = VectorWriter(store, batch_size=2, interval=60)  # type: ignore
+
+        futures = [writer.write(vectors("a")), writer.write(vectors("b", "c"))]
+        done, _ = wait(futures, timeout=5)
+        assert len(done) == 2
+        assert store.upserts == [["a", "b"], ["c"]]
+
+    def test_writes_old_batches(self):
+        store = FakeStore()
+        writer = VectorWriter(store, batch_size=100, interval=0.05)  # type: ignore
+
+        writer.write(vectors("a")).result(timeout=5)
+        assert store.upserts == [["a"]]
+
+    def test_skips_empty_writes(self):
+        store = FakeStore()
+        writer = VectorWriter(store, batch_size=1, interval=60)  # type: ignore
+
+        assert writer.write([]).done()
+        writer.flush()
+        assert not store.upserts
+
+    def test_fails_every_future(self):
+        store = FakeStore(error=ValueError("boom"))
+        writer = VectorWriter(store, batch_size=2, interval=60)  # type: ignore
+
+        futures = [writer.write(vectors("a")), writer.write(vectors("b"))]
+        for future in futures:
+            with pytest.raises(ValueError, match="boom"):
+                future.result(timeout=5)
+
+    def test_flush_writes_the_buffer(self):
+        store = FakeStore()
+        writer = VectorWriter(store, batch_size=100, interval=60)  # type: ignore
+
+        future = writer.write(vectors("a", "b"))
+        writer.flush()
+        assert future.done()
+        assert store.upserts == [["a", "b"]]
+
+    def test_flush_waits_for_in_flight_writes(self):
+        store = FakeStore()
+        store.release.clear()
+        writer = VectorWriter(store, batch_size=1, interval=60)  # type: ignore
+
+        future = writer.write(vectors("a"))
+        flusher = Thread(target=writer.flush)
+        flusher.start()
+        flusher.join(timeout=0.1)
+        assert flusher.is_alive()
+        assert not future.done()
+
+        store.release.set()
+        flusher.join(timeout=5)
+        assert not flusher.is_alive()
+        assert future.done()
+        assert store.upserts == [["a"]]